@@ -1,11 +1,15 @@
 from gevent import monkey
 monkey.patch_all()
 
+# psycopg2 is a C driver that monkey patching can't reach; its wait callback
+# makes queries yield to other greenlets instead of blocking the worker
+from psycogreen.gevent import patch_psycopg
+patch_psycopg()
+
 from flask import Flask
 from config import Config
-from extensions import db, sock
+from extensions import db, db_monitor, identity_cache, sock, http_client, event_bus, push_dispatcher, tenant_router, warm_pool, outbox_relay, order_ingest, menu_extractor
 from flask_login import LoginManager
-from models import User
 
 def create_app():
     app = Flask(__name__)
@@ -36,9 +40,19 @@ def create_app():
     logging.getLogger().addHandler(handler)
     logging.getLogger().setLevel(logging.INFO)
 
-    # Initialize extensions
+    # Initialize extensions (db_monitor first: it sets the engine's pool class)
+    db_monitor.init_app(app)
     db.init_app(app)
     sock.init_app(app)
+    http_client.init_app(app)
+    event_bus.init_app(app)
+    push_dispatcher.init_app(app)
+    tenant_router.init_app(app)
+    identity_cache.init_app(app)
+    warm_pool.init_app(app)
+    outbox_relay.init_app(app)
+    order_ingest.init_app(app)
+    menu_extractor.init_app(app)
     
     login_manager = LoginManager()
     login_manager.login_view = 'auth.login'
@@ -46,7 +60,8 @@ def create_app():
     
     @login_manager.user_loader
     def load_user(user_id):
-        return User.query.get(int(user_id))
+        # Cached auth columns only; see services/identity.py
+        return identity_cache.get(int(user_id))
 
     # Register Blueprints
     from routes.auth import auth_bp
@@ -55,6 +70,7 @@ def create_app():
     from routes.admin import admin_bp
     from routes.notifications import notifications_bp
     from routes.test_routes import test_bp
+    from routes.metrics import metrics_bp
     
     app.register_blueprint(auth_bp)
     app.register_blueprint(orders_bp)
@@ -62,6 +78,7 @@ def create_app():
     app.register_blueprint(voice_bp)
     app.register_blueprint(notifications_bp)
     app.register_blueprint(test_bp)
+    app.register_blueprint(metrics_bp)
     
     with app.app_context():
         db.create_all()
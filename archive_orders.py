@@ -0,0 +1,24 @@
+import argparse
+
+from app import create_app
+from services.archive import OrderArchiver
+
+app = create_app()
+
+def archive_orders():
+    parser = argparse.ArgumentParser(description="Move old completed orders into the monthly-partitioned archive")
+    parser.add_argument('--older-than-days', type=int, default=app.config['ARCHIVE_AFTER_DAYS'])
+    parser.add_argument('--batch-size', type=int, default=app.config['ARCHIVE_BATCH_SIZE'])
+    parser.add_argument('--pause', type=float, default=app.config['ARCHIVE_BATCH_PAUSE'],
+                        help="Seconds to wait between batches")
+    parser.add_argument('--max-batches', type=int, default=None,
+                        help="Stop after this many batches (run again to continue)")
+    args = parser.parse_args()
+
+    with app.app_context():
+        archiver = OrderArchiver(batch_size=args.batch_size, pause=args.pause)
+        moved = archiver.run(args.older_than_days, max_batches=args.max_batches)
+        print(f"Archived {moved} orders older than {args.older_than_days} days in {archiver.stats['batches']} batches")
+
+if __name__ == "__main__":
+    archive_orders()
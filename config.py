@@ -13,6 +13,21 @@ class Config:
         
     SQLALCHEMY_DATABASE_URI = uri
     SQLALCHEMY_TRACK_MODIFICATIONS = False
+    # Connection pool per worker process. Voice calls, SSE streams and
+    # background greenlets share it, so size for concurrent DB users
+    SQLALCHEMY_ENGINE_OPTIONS = {
+        'pool_pre_ping': os.environ.get('DB_POOL_PRE_PING', 'true').lower() in ('1', 'true', 'yes'),
+        'pool_recycle': int(os.environ.get('DB_POOL_RECYCLE', 1800)),
+    }
+    if uri and uri.startswith('postgresql'):
+        SQLALCHEMY_ENGINE_OPTIONS.update({
+            'pool_size': int(os.environ.get('DB_POOL_SIZE', 10)),
+            'max_overflow': int(os.environ.get('DB_MAX_OVERFLOW', 20)),
+            'pool_timeout': int(os.environ.get('DB_POOL_TIMEOUT', 10)),
+        })
+    # Log statements slower than this; report greenlets blocking the event loop longer than that (0 disables)
+    DB_SLOW_QUERY_MS = int(os.environ.get('DB_SLOW_QUERY_MS', 200))
+    LOOP_BLOCK_THRESHOLD_MS = int(os.environ.get('LOOP_BLOCK_THRESHOLD_MS', 100))
     
     # Vonage
     VONAGE_API_KEY = os.environ.get('VONAGE_API_KEY')
@@ -22,10 +37,69 @@ class Config:
     
     # OpenAI
     OPENAI_API_KEY = os.environ.get('OPENAI_API_KEY')
+    # Realtime WebSocket endpoint (overridden by loadtest.py to point at its fake server)
+    OPENAI_REALTIME_URL = os.environ.get('OPENAI_REALTIME_URL', 'wss://api.openai.com/v1/realtime?model=gpt-realtime')
+    # Seconds a connection pre-warmed at /webhooks/answer waits for its call,
+    # and how long voice_stream waits for an in-flight handshake
+    REALTIME_PREWARM_TIMEOUT = int(os.environ.get('REALTIME_PREWARM_TIMEOUT', 30))
+    REALTIME_PREWARM_CLAIM_WAIT = int(os.environ.get('REALTIME_PREWARM_CLAIM_WAIT', 5))
+    # The warm connection lives in the worker that answered; with several workers
+    # the stream often reaches another one and the connection is wasted, so
+    # pre-warming defaults to off then (see voice_prewarm_connections_total)
+    REALTIME_PREWARM = os.environ.get(
+        'REALTIME_PREWARM', 'true' if int(os.environ.get('WEB_CONCURRENCY', 1)) <= 1 else 'false'
+    ).lower() in ('1', 'true', 'yes')
+    # Most pre-warmed connections held open at once per worker
+    REALTIME_PREWARM_MAX_PENDING = int(os.environ.get('REALTIME_PREWARM_MAX_PENDING', 10))
+    # Caller audio is sent to OpenAI in chunks of this many ms (20 = one append per Vonage frame)
+    UPLINK_FLUSH_MS = int(os.environ.get('UPLINK_FLUSH_MS', 80))
+    # Caller audio allowed to wait on a slow OpenAI socket before new audio is dropped
+    UPLINK_MAX_QUEUED_MS = int(os.environ.get('UPLINK_MAX_QUEUED_MS', 2000))
+    # Local VAD pre-filter: stop streaming sustained silence to OpenAI.
+    # Hangover must stay above the server VAD silence_duration_ms (400).
+    VAD_ENABLED = os.environ.get('VAD_ENABLED', 'false').lower() in ('1', 'true', 'yes')
+    VAD_THRESHOLD_RMS = float(os.environ.get('VAD_THRESHOLD_RMS', 300))
+    VAD_HANGOVER_MS = int(os.environ.get('VAD_HANGOVER_MS', 600))
+    VAD_PREROLL_MS = int(os.environ.get('VAD_PREROLL_MS', 300))
+    VAD_KEEPALIVE_MS = int(os.environ.get('VAD_KEEPALIVE_MS', 1000))
+    # Audio profile for tenants without one (see services/codecs.py AUDIO_PROFILES)
+    DEFAULT_AUDIO_PROFILE = os.environ.get('DEFAULT_AUDIO_PROFILE', 'l16_24k')
+    # 20ms frames queued before assistant audio starts playing (jitter buffer)
+    DOWNLINK_PREBUFFER_FRAMES = int(os.environ.get('DOWNLINK_PREBUFFER_FRAMES', 3))
     
     # Server
     PUBLIC_URL = os.environ.get('PUBLIC_URL')
 
+    # Server-Sent Events
+    SSE_BUFFER_SIZE = int(os.environ.get('SSE_BUFFER_SIZE', 500))
+    SSE_KEEPALIVE_SECONDS = int(os.environ.get('SSE_KEEPALIVE_SECONDS', 15))
+    # 'postgres' fans events out to every worker/machine via LISTEN/NOTIFY,
+    # 'memory' only works with a single worker
+    EVENT_BACKEND = os.environ.get('EVENT_BACKEND') or ('postgres' if uri and uri.startswith('postgresql') else 'memory')
+    EVENT_CHANNEL = os.environ.get('EVENT_CHANNEL', 'order_events')
+
+    # Dashboard: max cards per active column, page size for completed orders
+    DASHBOARD_ACTIVE_LIMIT = int(os.environ.get('DASHBOARD_ACTIVE_LIMIT', 200))
+    DASHBOARD_DONE_PAGE_SIZE = int(os.environ.get('DASHBOARD_DONE_PAGE_SIZE', 20))
+    # Most changed orders returned by one delta poll; the client fetches again with the new cursor
+    DASHBOARD_DELTA_LIMIT = int(os.environ.get('DASHBOARD_DELTA_LIMIT', 500))
+
+    # Menus with more items than this only list item names in the prompt;
+    # the agent fetches prices and options with the lookup_menu tool
+    MENU_INLINE_MAX_ITEMS = int(os.environ.get('MENU_INLINE_MAX_ITEMS', 40))
+
+    # Seconds a logged-in user's auth columns are cached per worker
+    USER_CACHE_TTL = int(os.environ.get('USER_CACHE_TTL', 60))
+
+    # archive_orders.py moves completed orders older than this many days to
+    # orders_archive, batch_size rows per short transaction, pausing in between
+    ARCHIVE_AFTER_DAYS = int(os.environ.get('ARCHIVE_AFTER_DAYS', 90))
+    ARCHIVE_BATCH_SIZE = int(os.environ.get('ARCHIVE_BATCH_SIZE', 1000))
+    ARCHIVE_BATCH_PAUSE = float(os.environ.get('ARCHIVE_BATCH_PAUSE', 0.1))
+
+    # Seconds before the in-process phone number -> tenant routing cache is reloaded
+    TENANT_CACHE_TTL = int(os.environ.get('TENANT_CACHE_TTL', 300))
+
     # Defaults
     DEFAULT_SYSTEM_PROMPT = os.environ.get('DEFAULT_SYSTEM_PROMPT', "You are a helpful AI assistant taking food orders.")
 
@@ -33,3 +107,39 @@ class Config:
     VAPID_PRIVATE_KEY = os.environ.get('VAPID_PRIVATE_KEY')
     VAPID_PUBLIC_KEY = os.environ.get('VAPID_PUBLIC_KEY')
     VAPID_CLAIM_EMAIL = os.environ.get('VAPID_CLAIM_EMAIL', 'mailto:admin@example.com')
+    PUSH_POOL_SIZE = int(os.environ.get('PUSH_POOL_SIZE', 10))
+    PUSH_QUEUE_SIZE = int(os.environ.get('PUSH_QUEUE_SIZE', 100))
+    # Merge new-order pushes arriving within this many seconds of each other,
+    # never holding the first one longer than the max delay (0 disables)
+    PUSH_COALESCE_WINDOW = float(os.environ.get('PUSH_COALESCE_WINDOW', 2.0))
+    PUSH_COALESCE_MAX_DELAY = float(os.environ.get('PUSH_COALESCE_MAX_DELAY', 5.0))
+    # Re-sign a cached VAPID header this many seconds before it expires
+    VAPID_REFRESH_MARGIN = int(os.environ.get('VAPID_REFRESH_MARGIN', 300))
+
+    # Orders from calls are committed by background workers; dashboard events
+    # and pushes are then delivered from the outbox table
+    ORDER_INGEST_WORKERS = int(os.environ.get('ORDER_INGEST_WORKERS', 4))
+    ORDER_INGEST_QUEUE_SIZE = int(os.environ.get('ORDER_INGEST_QUEUE_SIZE', 100))
+    # Outbox rows not delivered right after commit (e.g. after a crash) are picked up this often
+    OUTBOX_POLL_SECONDS = float(os.environ.get('OUTBOX_POLL_SECONDS', 5))
+    OUTBOX_BATCH_SIZE = int(os.environ.get('OUTBOX_BATCH_SIZE', 100))
+
+    # Menu photo extraction: concurrent vision calls per worker and their timeouts
+    MENU_EXTRACTION_CONCURRENCY = int(os.environ.get('MENU_EXTRACTION_CONCURRENCY', 4))
+    MENU_EXTRACTION_CONNECT_TIMEOUT = float(os.environ.get('MENU_EXTRACTION_CONNECT_TIMEOUT', 5))
+    MENU_EXTRACTION_READ_TIMEOUT = float(os.environ.get('MENU_EXTRACTION_READ_TIMEOUT', 90))
+    # Seconds a menu job may run; jobs left running longer (worker died) are reported failed
+    MENU_JOB_TIMEOUT = int(os.environ.get('MENU_JOB_TIMEOUT', 600))
+
+    # Shared outbound HTTP client (services/http_client.py): keep-alive
+    # connections per host, timeouts in seconds, retries on errors and 429/5xx (POSTs only when nothing was sent)
+    HTTP_CLIENT_POOL_SIZE = int(os.environ.get('HTTP_CLIENT_POOL_SIZE', 50))
+    HTTP_CLIENT_CONNECT_TIMEOUT = float(os.environ.get('HTTP_CLIENT_CONNECT_TIMEOUT', 3.05))
+    HTTP_CLIENT_READ_TIMEOUT = float(os.environ.get('HTTP_CLIENT_READ_TIMEOUT', 30))
+    HTTP_CLIENT_RETRIES = int(os.environ.get('HTTP_CLIENT_RETRIES', 2))
+    HTTP_CLIENT_BACKOFF = float(os.environ.get('HTTP_CLIENT_BACKOFF', 0.5))
+    # HTTP/2 to push services that support it (needs httpx[http2])
+    HTTP_CLIENT_HTTP2 = os.environ.get('HTTP_CLIENT_HTTP2', 'false').lower() in ('1', 'true', 'yes')
+
+    # Bearer token required to scrape /metrics (open when unset)
+    METRICS_TOKEN = os.environ.get('METRICS_TOKEN')
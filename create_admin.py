@@ -1,6 +1,7 @@
 from app import create_app
 from extensions import db
 from models import User
+from services.menu import replace_menu
 
 app = create_app()
 
@@ -17,15 +18,17 @@ def create_admin():
             admin = User(
                 username=target_username,
                 company="My Restaurant",
-                phone_number="123456789",
                 agent_on=True,
                 voice='sage',
                 is_admin=True,
-                system_prompt="You are a helpful assistant.",
-                menu="Burger: $10"
+                system_prompt="You are a helpful assistant."
             )
+            admin.set_phone("123456789")
             admin.set_password(target_password)
             db.session.add(admin)
+            # Flush for the id; replace_menu also builds menu_items and bumps menu_version
+            db.session.flush()
+            replace_menu(admin, "Burger: $10")
             db.session.commit()
             print(f"Admin user '{target_username}' created successfully with password '{target_password}'!")
         else:
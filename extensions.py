@@ -1,5 +1,25 @@
 from flask_sqlalchemy import SQLAlchemy
 from flask_sock import Sock
+from services.event_bus import EventBus
+from services.push import PushDispatcher
+from services.tenants import TenantRouter
+from services.identity import IdentityCache
+from services.realtime_pool import WarmConnectionPool
+from services.outbox import OutboxRelay
+from services.order_ingest import OrderIngest
+from services.menu_extraction import MenuExtractor
+from services.http_client import HttpClient
+from services.db_monitor import DatabaseMonitor
 
 db = SQLAlchemy()
+db_monitor = DatabaseMonitor()
+http_client = HttpClient()
 sock = Sock()
+event_bus = EventBus()
+push_dispatcher = PushDispatcher()
+tenant_router = TenantRouter()
+identity_cache = IdentityCache()
+warm_pool = WarmConnectionPool()
+outbox_relay = OutboxRelay()
+order_ingest = OrderIngest()
+menu_extractor = MenuExtractor()
@@ -0,0 +1,18 @@
+# Loaded by gunicorn from the working directory (see Dockerfile)
+import os
+import shutil
+
+
+def on_starting(server):
+    # Multiprocess metric files from a previous run would be summed with the new ones
+    metrics_dir = os.environ.get('PROMETHEUS_MULTIPROC_DIR')
+    if metrics_dir:
+        shutil.rmtree(metrics_dir, ignore_errors=True)
+        os.makedirs(metrics_dir, exist_ok=True)
+
+
+def child_exit(server, worker):
+    # Drop a dead worker's livesum gauges (active calls, open SSE streams)
+    if os.environ.get('PROMETHEUS_MULTIPROC_DIR'):
+        from prometheus_client import multiprocess
+        multiprocess.mark_process_dead(worker.pid)
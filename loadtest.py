@@ -0,0 +1,420 @@
+"""
+Offline load test for the voice path.
+
+Starts the app under gunicorn against a local fake OpenAI realtime server
+and drives simulated Vonage callers through /webhooks/answer and
+/voice/stream. Nothing leaves the machine and no API key is needed.
+
+Each simulated call speaks --turns times (a 1s tone, then silence) at
+real-time rate. The fake server runs an energy VAD like OpenAI's
+server_vad: it answers every turn with --response-ms of audio after
+--model-delay-ms, and on the last turn calls create_order_tool first.
+
+    python loadtest.py --calls 200 --concurrency 50
+    python loadtest.py --calls 20 --concurrency 20 --profile ulaw_8k --vad
+
+Linux only: app CPU and memory are read from /proc.
+"""
+from gevent import monkey
+monkey.patch_all()
+
+import argparse
+import base64
+import json
+import os
+import socket
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+import uuid
+
+import gevent
+import numpy as np
+import requests
+import websocket
+from flask import Flask
+from flask_sock import Sock
+from gevent.lock import Semaphore
+from gevent.pool import Pool
+from gevent.pywsgi import WSGIServer
+
+from services.codecs import ULAW_DECODE, ULAW_ENCODE
+
+FRAME_MS = 20
+SPEECH_MS = 1000
+TONE_AMPLITUDE = 8000
+SPEECH_RMS = 500
+# Same silence the real session's server_vad waits for (silence_duration_ms)
+SILENCE_DURATION_MS = 400
+DELTA_MS = 100
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def tone(rate, ms, freq=440):
+    t = np.arange(rate * ms // 1000) / rate
+    return (np.sin(2 * np.pi * freq * t) * TONE_AMPLITUDE).astype('<i2')
+
+
+def percentile(values, pct):
+    if not values:
+        return float('nan')
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+class FakeRealtimeSession:
+    """Plays the OpenAI side of one call over the app's realtime WebSocket."""
+
+    def __init__(self, ws, args, totals):
+        self.ws = ws
+        self.args = args
+        self.totals = totals
+        self._send_lock = Semaphore()
+        self.audio_format = 'pcm16'
+        self.speaking = False
+        self.silence_ms = 0
+        self.turn = 0
+
+    def send(self, event):
+        with self._send_lock:
+            self.ws.send(json.dumps(event))
+
+    def run(self):
+        self.totals['sessions'] += 1
+        while True:
+            try:
+                event = json.loads(self.ws.receive())
+            except Exception:
+                return
+            event_type = event.get('type')
+
+            if event_type == 'session.update':
+                self.audio_format = event['session'].get('input_audio_format', 'pcm16')
+                self.send({'type': 'session.updated'})
+            elif event_type == 'input_audio_buffer.append':
+                self.on_audio(base64.b64decode(event['audio']))
+            elif event_type == 'conversation.item.create' and event['item'].get('type') == 'function_call_output':
+                if json.loads(event['item']['output']).get('status') == 'success':
+                    self.totals['orders_acked'] += 1
+            elif event_type == 'response.create':
+                gevent.spawn(self.respond_audio)
+
+    def on_audio(self, audio):
+        if self.audio_format == 'g711_ulaw':
+            samples = ULAW_DECODE[np.frombuffer(audio, dtype=np.uint8)]
+            audio_ms = len(audio) / 8
+        else:
+            samples = np.frombuffer(audio, dtype='<i2')
+            audio_ms = len(audio) / 48
+        samples = samples.astype(np.float32)
+        rms = float(np.sqrt(np.dot(samples, samples) / samples.size)) if samples.size else 0
+
+        if rms > SPEECH_RMS:
+            self.silence_ms = 0
+            if not self.speaking:
+                self.speaking = True
+                self.send({'type': 'input_audio_buffer.speech_started'})
+            return
+
+        if self.speaking:
+            self.silence_ms += audio_ms
+            if self.silence_ms >= SILENCE_DURATION_MS:
+                self.speaking = False
+                self.turn += 1
+                self.send({'type': 'input_audio_buffer.speech_stopped'})
+                gevent.spawn(self.respond)
+
+    def respond(self):
+        gevent.sleep(self.args.model_delay_ms / 1000)
+        if self.turn < self.args.turns:
+            self.respond_audio()
+            return
+        # Last turn: submit the order; the app answers with function_call_output + response.create
+        self.send({
+            'type': 'response.function_call_arguments.done',
+            'name': 'create_order_tool',
+            'call_id': f"call_{uuid.uuid4().hex[:12]}",
+            'arguments': json.dumps({
+                'order_details': '2 pizzas margherita, 1 coca',
+                'customer_name': 'Load Test',
+                'customer_address': '1 rue du Test'
+            })
+        })
+
+    def respond_audio(self):
+        item_id = f"item_{uuid.uuid4().hex[:12]}"
+        rate = 8000 if self.audio_format == 'g711_ulaw' else 24000
+        chunk = tone(rate, DELTA_MS, freq=220)
+        if self.audio_format == 'g711_ulaw':
+            payload = ULAW_ENCODE[chunk.view(np.uint16)].tobytes()
+        else:
+            payload = chunk.tobytes()
+        delta = base64.b64encode(payload).decode('ascii')
+
+        for _ in range(self.args.response_ms // DELTA_MS):
+            self.send({'type': 'response.audio.delta', 'item_id': item_id, 'content_index': 0, 'delta': delta})
+            # Deltas arrive in bursts, much faster than real time
+            gevent.sleep(0.005)
+        self.send({'type': 'response.audio.done', 'item_id': item_id})
+        self.send({'type': 'response.done'})
+
+
+def start_fake_openai(port, args, totals):
+    fake = Flask('fake_openai')
+    sock = Sock(fake)
+
+    @sock.route('/v1/realtime')
+    def realtime(ws):
+        FakeRealtimeSession(ws, args, totals).run()
+
+    server = WSGIServer(('127.0.0.1', port), fake, log=None)
+    server.start()
+    return server
+
+
+def start_app(port, openai_port, workdir, args):
+    env = dict(os.environ)
+    env.update({
+        'DATABASE_URL': f"sqlite:///{os.path.join(workdir, 'loadtest.db')}",
+        'OPENAI_API_KEY': 'loadtest',
+        'OPENAI_REALTIME_URL': f"ws://127.0.0.1:{openai_port}/v1/realtime",
+        'EVENT_BACKEND': 'memory',
+        'DEFAULT_AUDIO_PROFILE': args.profile,
+        'VAD_ENABLED': 'true' if args.vad else 'false',
+        'PUBLIC_URL': '',
+    })
+    if args.workers > 1:
+        env['PROMETHEUS_MULTIPROC_DIR'] = os.path.join(workdir, 'metrics')
+        os.makedirs(env['PROMETHEUS_MULTIPROC_DIR'])
+
+    root = os.path.dirname(os.path.abspath(__file__))
+    proc = subprocess.Popen(
+        [sys.executable, '-m', 'gunicorn', '-c', 'gunicorn.conf.py', '-k', 'gevent', '-w', str(args.workers),
+         '-b', f"127.0.0.1:{port}", '--log-level', 'warning', 'app:app'],
+        cwd=root, env=env, stdout=subprocess.DEVNULL if args.quiet else None, stderr=subprocess.STDOUT
+    )
+
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        if proc.poll() is not None:
+            sys.exit(f"App exited during startup with code {proc.returncode}")
+        try:
+            requests.get(f"http://127.0.0.1:{port}/metrics", timeout=1)
+            return proc
+        except requests.RequestException:
+            gevent.sleep(0.2)
+    proc.terminate()
+    sys.exit("App did not start within 30s")
+
+
+def process_tree(pid):
+    pids = [pid]
+    for entry in os.listdir('/proc'):
+        if entry.isdigit():
+            try:
+                with open(f"/proc/{entry}/stat") as f:
+                    if int(f.read().rsplit(')', 1)[1].split()[1]) == pid:
+                        pids.append(int(entry))
+            except (OSError, IndexError, ValueError):
+                pass
+    return pids
+
+
+def cpu_seconds(pids):
+    total = 0
+    for pid in pids:
+        try:
+            with open(f"/proc/{pid}/stat") as f:
+                fields = f.read().rsplit(')', 1)[1].split()
+            total += int(fields[11]) + int(fields[12])
+        except OSError:
+            pass
+    return total / os.sysconf('SC_CLK_TCK')
+
+
+def rss_bytes(pids):
+    total = 0
+    for pid in pids:
+        try:
+            with open(f"/proc/{pid}/status") as f:
+                for line in f:
+                    if line.startswith('VmRSS:'):
+                        total += int(line.split()[1]) * 1024
+        except OSError:
+            pass
+    return total
+
+
+def run_caller(index, base_url, args):
+    """One simulated Vonage call. Returns a result dict."""
+    result = {'ok': False, 'turn_latencies': [], 'frames_received': 0, 'late_sends': 0}
+    started = time.monotonic()
+    try:
+        ncco = requests.post(f"{base_url}/webhooks/answer", timeout=10, json={
+            'to': args.number,
+            'from': f"+3370000{index % 10000:04d}",
+        }).json()
+        endpoint = ncco[0]['endpoint'][0]
+        rate = int(endpoint['content-type'].split('rate=')[1])
+        ws = websocket.create_connection(endpoint['uri'], timeout=30)
+    except Exception as e:
+        result['error'] = f"setup: {e}"
+        return result
+    result['setup_s'] = time.monotonic() - started
+
+    frame_samples = rate * FRAME_MS // 1000
+    speech = tone(rate, SPEECH_MS).tobytes()
+    speech_frames = [speech[i:i + frame_samples * 2] for i in range(0, len(speech), frame_samples * 2)]
+    silence = bytes(frame_samples * 2)
+    state = {'awaiting': None}
+
+    def receive():
+        while True:
+            try:
+                data = ws.recv()
+            except Exception:
+                return
+            if not data:
+                return
+            if isinstance(data, bytes):
+                result['frames_received'] += 1
+                if state['awaiting'] is not None:
+                    result['turn_latencies'].append(time.monotonic() - state['awaiting'])
+                    state['awaiting'] = None
+
+    receiver = gevent.spawn(receive)
+    gap_frames = int(args.gap_ms / FRAME_MS)
+    next_send = time.monotonic()
+    try:
+        for _ in range(args.turns):
+            for frame in speech_frames + [silence] * gap_frames:
+                ws.send_binary(frame)
+                if frame is speech_frames[-1]:
+                    state['awaiting'] = time.monotonic()
+                next_send += FRAME_MS / 1000
+                delay = next_send - time.monotonic()
+                if delay > 0:
+                    gevent.sleep(delay)
+                elif delay < -FRAME_MS / 1000:
+                    # The harness itself can't keep real time at this load
+                    result['late_sends'] += 1
+        result['ok'] = True
+    except Exception as e:
+        result['error'] = f"stream: {e}"
+    finally:
+        try:
+            ws.close()
+        except Exception:
+            pass
+        receiver.join(timeout=2)
+    return result
+
+
+def scrape(base_url):
+    from prometheus_client.parser import text_string_to_metric_families
+    samples = {}
+    for family in text_string_to_metric_families(requests.get(f"{base_url}/metrics", timeout=5).text):
+        for sample in family.samples:
+            key = sample.name + ''.join(f",{k}={v}" for k, v in sorted(sample.labels.items()))
+            samples[key] = samples.get(key, 0) + sample.value
+    return samples
+
+
+def report(args, results, elapsed, cpu_s, rss_peak, rss_base, orders, totals, server):
+    done = [r for r in results if r['ok']]
+    failed = [r for r in results if not r['ok']]
+    latencies = [l * 1000 for r in done for l in r['turn_latencies']]
+    setups = [r['setup_s'] * 1000 for r in results if 'setup_s' in r]
+    expected_frames = len(done) * args.turns * (args.response_ms // FRAME_MS)
+    received_frames = sum(r['frames_received'] for r in done)
+
+    print()
+    print(f"calls          {len(done)} ok, {len(failed)} failed in {elapsed:.1f}s "
+          f"({len(done) / elapsed:.2f} calls/s, concurrency {args.concurrency})")
+    for r in failed[:5]:
+        print(f"  failure      {r.get('error')}")
+    print(f"turn latency   p50={percentile(latencies, 50):.0f}ms p99={percentile(latencies, 99):.0f}ms "
+          f"max={max(latencies, default=float('nan')):.0f}ms over {len(latencies)} turns "
+          f"(incl. {SILENCE_DURATION_MS}ms VAD silence + {args.model_delay_ms}ms fake model delay)")
+    print(f"call setup     p50={percentile(setups, 50):.0f}ms p99={percentile(setups, 99):.0f}ms "
+          f"(answer webhook + stream connect)")
+    print(f"downlink       {received_frames}/{expected_frames} frames received "
+          f"({max(expected_frames - received_frames, 0)} missing)")
+    print(f"dropped        uplink_backpressure={server.get('voice_dropped_frames_total,reason=uplink_backpressure', 0):.0f} "
+          f"barge_in={server.get('voice_dropped_frames_total,reason=barge_in', 0):.0f}")
+    turn_count = server.get('voice_turn_latency_seconds_count', 0)
+    if turn_count:
+        print(f"server turns   mean={server['voice_turn_latency_seconds_sum'] / turn_count * 1000:.0f}ms "
+              f"(speech_stopped -> first delta, {turn_count:.0f} turns)")
+    print(f"app cpu        {cpu_s:.1f}s total, {cpu_s * 1000 / max(len(done), 1):.0f}ms per call")
+    print(f"app memory     peak rss {rss_peak / 2**20:.0f}MB, "
+          f"{(rss_peak - rss_base) / 1024 / max(args.concurrency, 1):.0f}KB per concurrent call")
+    print(f"orders         {orders} persisted, {totals['orders_acked']} acknowledged to the model, "
+          f"{len(done)} expected")
+    late = sum(r['late_sends'] for r in results)
+    if late:
+        print(f"warning        harness fell behind real time on {late} frames; results are pessimistic")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--calls', type=int, default=50, help='total calls to place')
+    parser.add_argument('--concurrency', type=int, default=10, help='calls in flight at once')
+    parser.add_argument('--turns', type=int, default=3, help='caller turns per call; the last one places the order')
+    parser.add_argument('--response-ms', type=int, default=2000, help='assistant audio per turn')
+    parser.add_argument('--model-delay-ms', type=int, default=300, help='fake model think time before replying')
+    parser.add_argument('--gap-ms', type=int, default=None, help='caller silence after each turn')
+    parser.add_argument('--profile', default='l16_24k', help='audio profile for the simulated tenant')
+    parser.add_argument('--vad', action='store_true', help='enable the local VAD gate in the app')
+    parser.add_argument('--workers', type=int, default=1, help='gunicorn workers')
+    parser.add_argument('--number', default='+33600000000', help='number to call (unknown numbers use the default agent)')
+    parser.add_argument('--quiet', action='store_true', help='hide app output')
+    args = parser.parse_args()
+    if args.gap_ms is None:
+        args.gap_ms = args.model_delay_ms + args.response_ms + 1500
+
+    totals = {'sessions': 0, 'orders_acked': 0}
+    workdir = tempfile.mkdtemp(prefix='loadtest-')
+    openai_port, app_port = free_port(), free_port()
+    base_url = f"http://127.0.0.1:{app_port}"
+
+    fake = start_fake_openai(openai_port, args, totals)
+    app = start_app(app_port, openai_port, workdir, args)
+    try:
+        pids = process_tree(app.pid)
+        cpu_base = cpu_seconds(pids)
+        rss_base = rss_bytes(pids)
+        rss_peak = rss_base
+
+        print(f"Placing {args.calls} calls, {args.concurrency} at a time, profile={args.profile} vad={args.vad}")
+        pool = Pool(args.concurrency)
+        started = time.monotonic()
+        jobs = [pool.spawn(run_caller, i, base_url, args) for i in range(args.calls)]
+        while not all(job.ready() for job in jobs):
+            rss_peak = max(rss_peak, rss_bytes(pids))
+            gevent.sleep(0.5)
+        elapsed = time.monotonic() - started
+        cpu_s = cpu_seconds(pids) - cpu_base
+
+        # Give in-flight commits a moment before counting
+        gevent.sleep(1)
+        server = scrape(base_url)
+        with sqlite3.connect(os.path.join(workdir, 'loadtest.db')) as conn:
+            orders = conn.execute("SELECT COUNT(*) FROM orders").fetchone()[0]
+
+        report(args, [job.value for job in jobs], elapsed, cpu_s, rss_peak, rss_base, orders, totals, server)
+    finally:
+        app.terminate()
+        app.wait(timeout=10)
+        fake.stop()
+
+
+if __name__ == '__main__':
+    main()
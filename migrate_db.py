@@ -1,35 +1,91 @@
 from app import create_app
 from extensions import db
+from models import User, MenuItem, normalize_phone
+from services.menu import replace_menu
 from sqlalchemy import text
 
 app = create_app()
 
+def run_step(description, *statements):
+    # Each step commits on its own, so one failure can't abort the steps after it
+    try:
+        with db.engine.begin() as conn:
+            for statement in statements:
+                conn.execute(text(statement))
+        print(description)
+    except Exception as e:
+        print(f"{description} failed: {e}")
+
 def migrate():
     with app.app_context():
-        # Check if columns exist, if not add them
-        with db.engine.connect() as conn:
-            # Check agent_on
-            try:
-                conn.execute(text("ALTER TABLE users ADD COLUMN agent_on BOOLEAN DEFAULT TRUE"))
-                print("Added agent_on column")
-            except Exception as e:
-                print(f"agent_on column might already exist: {e}")
-                
-            # Check voice
-            try:
-                conn.execute(text("ALTER TABLE users ADD COLUMN voice VARCHAR(20) DEFAULT 'sage'"))
-                print("Added voice column")
-            except Exception as e:
-                print(f"voice column might already exist: {e}")
-                
-            # Check is_admin
-            try:
-                conn.execute(text("ALTER TABLE users ADD COLUMN is_admin BOOLEAN DEFAULT FALSE"))
-                print("Added is_admin column")
-            except Exception as e:
-                print(f"is_admin column might already exist: {e}")
-            
-            conn.commit()
+        # Column changes first: the ORM queries below select every mapped column
+        run_step("Added agent_on column",
+                 "ALTER TABLE users ADD COLUMN IF NOT EXISTS agent_on BOOLEAN DEFAULT TRUE")
+        run_step("Added voice column",
+                 "ALTER TABLE users ADD COLUMN IF NOT EXISTS voice VARCHAR(20) DEFAULT 'sage'")
+        run_step("Added is_admin column",
+                 "ALTER TABLE users ADD COLUMN IF NOT EXISTS is_admin BOOLEAN DEFAULT FALSE")
+
+        # Per-tenant audio profile; NULL follows the DEFAULT_AUDIO_PROFILE setting
+        run_step("Added audio_profile column",
+                 "ALTER TABLE users ADD COLUMN IF NOT EXISTS audio_profile VARCHAR(20)",
+                 "ALTER TABLE users ALTER COLUMN audio_profile DROP DEFAULT")
+
+        # Tenant-scoped orders; orders created before tenants existed go to the first admin
+        run_step("Added orders.user_id column and index",
+                 "ALTER TABLE orders ADD COLUMN IF NOT EXISTS user_id INTEGER REFERENCES users(id) ON DELETE CASCADE",
+                 "CREATE INDEX IF NOT EXISTS ix_orders_user_status_created ON orders (user_id, status, created_at)",
+                 "UPDATE orders SET user_id = (SELECT id FROM users WHERE is_admin ORDER BY id LIMIT 1) "
+                 "WHERE user_id IS NULL")
+
+        # Deleting a restaurant deletes its orders (databases migrated before ON DELETE was set)
+        run_step("Set ON DELETE CASCADE on orders.user_id",
+                 "ALTER TABLE orders DROP CONSTRAINT IF EXISTS orders_user_id_fkey",
+                 "ALTER TABLE orders ADD CONSTRAINT orders_user_id_fkey "
+                 "FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE CASCADE")
+
+        # Change tracking for the dashboard delta feed
+        run_step("Added orders.updated_at column and index",
+                 "ALTER TABLE orders ADD COLUMN IF NOT EXISTS updated_at TIMESTAMP",
+                 "UPDATE orders SET updated_at = created_at WHERE updated_at IS NULL",
+                 "CREATE INDEX IF NOT EXISTS ix_orders_user_updated ON orders (user_id, updated_at)")
+
+        # Normalized phone numbers for call routing (filled in below)
+        run_step("Added phone_e164 column",
+                 "ALTER TABLE users ADD COLUMN IF NOT EXISTS phone_e164 VARCHAR(20)")
+
+        # Structured menus (menu_items table is created by db.create_all)
+        run_step("Added users.menu_version column",
+                 "ALTER TABLE users ADD COLUMN IF NOT EXISTS menu_version INTEGER DEFAULT 0")
+
+        # Push notifications scoped to the order's restaurant (outbox is created by db.create_all)
+        run_step("Added outbox.user_id column",
+                 "ALTER TABLE outbox ADD COLUMN IF NOT EXISTS user_id INTEGER")
+
+        # Menu job timeouts (menu_jobs is created by db.create_all)
+        run_step("Added menu_jobs.started_at column",
+                 "ALTER TABLE menu_jobs ADD COLUMN IF NOT EXISTS started_at TIMESTAMP")
+
+        # Order archive (orders_archive and its partitions are created by
+        # db.create_all and archive_orders.py); index for finding old orders
+        run_step("Added ix_orders_termine_created index",
+                 "CREATE INDEX IF NOT EXISTS ix_orders_termine_created ON orders (created_at) "
+                 "WHERE status = 'termine'")
+
+        for user in User.query.filter(User.phone_number.isnot(None)).all():
+            user.phone_e164 = normalize_phone(user.phone_number)
+        db.session.commit()
+
+        run_step("Added users.phone_e164 unique index",
+                 "CREATE UNIQUE INDEX IF NOT EXISTS ix_users_phone_e164 ON users (phone_e164)")
+
+        parsed = 0
+        for user in User.query.filter(User.menu.isnot(None)).all():
+            if not MenuItem.query.filter_by(user_id=user.id).first():
+                replace_menu(user, user.menu)
+                parsed += 1
+        db.session.commit()
+        print(f"Parsed menus into menu_items for {parsed} users")
 
 if __name__ == "__main__":
     migrate()
@@ -1,7 +1,23 @@
+import re
 from datetime import datetime
 from extensions import db
 from werkzeug.security import generate_password_hash, check_password_hash
 from flask_login import UserMixin
+from sqlalchemy.orm import deferred
+
+def normalize_phone(raw):
+    """
+    Normalize a phone number to E.164 ('+' followed by digits).
+    Vonage sends numbers without the '+', admins type them with spaces,
+    dashes or a '00' international prefix. Returns None if there are no digits.
+    """
+    if not raw:
+        return None
+    raw = raw.strip()
+    if raw.startswith('00'):
+        raw = raw[2:]
+    digits = re.sub(r'\D', '', raw)
+    return f"+{digits}" if digits else None
 
 class User(UserMixin, db.Model):
     __tablename__ = 'users'
@@ -10,13 +26,23 @@ class User(UserMixin, db.Model):
     username = db.Column(db.String(80), unique=True, nullable=False)
     company = db.Column(db.String(120))
     password_hash = db.Column(db.String(256))
-    system_prompt = db.Column(db.Text)
+    # Large text columns load on first access, not with every user query
+    system_prompt = deferred(db.Column(db.Text))
     phone_number = db.Column(db.String(20)) # The phone number associated with this account (business phone)
-    menu = db.Column(db.Text) # JSON or text representation of the menu
+    phone_e164 = db.Column(db.String(20), unique=True, index=True) # Normalized phone_number used for call routing
+    menu = deferred(db.Column(db.Text)) # Menu as text; parsed into menu_items by services/menu.py
+    menu_version = db.Column(db.Integer, default=0) # Bumped on every menu change (prompt cache key)
     agent_on = db.Column(db.Boolean, default=True)
     voice = db.Column(db.String(20), default='sage')
+    audio_profile = db.Column(db.String(20)) # Telephony/OpenAI codec profile (services/codecs.py); NULL uses DEFAULT_AUDIO_PROFILE
     is_admin = db.Column(db.Boolean, default=False)
+
+    menu_items = db.relationship('MenuItem', lazy='dynamic', cascade='all, delete-orphan')
     
+    def set_phone(self, phone):
+        self.phone_number = phone
+        self.phone_e164 = normalize_phone(phone)
+
     def set_password(self, password):
         self.password_hash = generate_password_hash(password)
         
@@ -30,6 +56,7 @@ class User(UserMixin, db.Model):
             'company': self.company,
             'phone_number': self.phone_number,
             'voice': self.voice,
+            'audio_profile': self.audio_profile,
             'agent_on': self.agent_on,
             'system_prompt': self.system_prompt,
             'menu': self.menu,
@@ -38,6 +65,14 @@ class User(UserMixin, db.Model):
 
 class Order(db.Model):
     __tablename__ = 'orders'
+    __table_args__ = (
+        # Serves the per-tenant, per-status dashboard columns and keyset paging
+        db.Index('ix_orders_user_status_created', 'user_id', 'status', 'created_at'),
+        # Serves the dashboard delta feed (/api/orders?since=...)
+        db.Index('ix_orders_user_updated', 'user_id', 'updated_at'),
+        # Lets the archiver find old completed orders without a table scan
+        db.Index('ix_orders_termine_created', 'created_at', postgresql_where=db.text("status = 'termine'")),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     status = db.Column(db.String(20), default='recu') # recu, en_cours, termine
@@ -46,9 +81,10 @@ class Order(db.Model):
     customer_phone = db.Column(db.String(20))
     address = db.Column(db.String(255))
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     
-    # Optional: Link order to a specific user (restaurant) if needed in future
-    # user_id = db.Column(db.Integer, db.ForeignKey('users.id'))
+    # Restaurant (tenant) the order belongs to
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id', ondelete='CASCADE'))
 
     def to_dict(self):
         return {
@@ -58,9 +94,104 @@ class Order(db.Model):
             'customer_name': self.customer_name,
             'customer_phone': self.customer_phone,
             'address': self.address,
-            'created_at': self.created_at.isoformat()
+            'user_id': self.user_id,
+            'created_at': self.created_at.isoformat(),
+            'updated_at': self.updated_at.isoformat() if self.updated_at else None
+        }
+
+class MenuItem(db.Model):
+    __tablename__ = 'menu_items'
+    __table_args__ = (
+        db.Index('ix_menu_items_user_position', 'user_id', 'position'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    position = db.Column(db.Integer, nullable=False) # Order on the menu
+    category = db.Column(db.String(120))
+    name = db.Column(db.String(255), nullable=False)
+    price = db.Column(db.String(30)) # As written on the menu, currency included
+    options = db.Column(db.Text) # Description, sizes, sauces...
+
+    def to_dict(self):
+        return {
+            'category': self.category,
+            'name': self.name,
+            'price': self.price,
+            'options': self.options
+        }
+
+class MenuExtraction(db.Model):
+    __tablename__ = 'menu_extractions'
+
+    # Vision output cached by content hash of the uploaded image (and prompt),
+    # so re-uploading the same menu page skips the model call
+    id = db.Column(db.Integer, primary_key=True)
+    content_hash = db.Column(db.String(64), unique=True, nullable=False)
+    menu_text = db.Column(db.Text, nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+class MenuJob(db.Model):
+    __tablename__ = 'menu_jobs'
+
+    id = db.Column(db.String(32), primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id', ondelete='CASCADE'), nullable=False)
+    status = db.Column(db.String(20), default='pending') # pending, running, done, failed
+    pages = db.Column(db.Integer, nullable=False)
+    cached_pages = db.Column(db.Integer, default=0)
+    menu_text = db.Column(db.Text)
+    error = db.Column(db.Text)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    started_at = db.Column(db.DateTime)
+    finished_at = db.Column(db.DateTime)
+
+    def to_dict(self):
+        return {
+            'job_id': self.id,
+            'status': self.status,
+            'pages': self.pages,
+            'cached_pages': self.cached_pages,
+            'menu_text': self.menu_text,
+            'error': self.error
         }
 
+class OutboxEvent(db.Model):
+    __tablename__ = 'outbox'
+
+    # Side effects committed in the same transaction as the change that
+    # caused them, delivered afterwards by services/outbox.py
+    id = db.Column(db.Integer, primary_key=True)
+    event_type = db.Column(db.String(50), nullable=False)
+    payload = db.Column(db.Text, nullable=False) # JSON event data for SSE
+    push = db.Column(db.Text) # JSON Web Push message, if any
+    coalesce_key = db.Column(db.String(50))
+    user_id = db.Column(db.Integer) # Restaurant whose subscriptions get the push
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+class ArchivedOrder(db.Model):
+    __tablename__ = 'orders_archive'
+    __table_args__ = (
+        db.Index('ix_orders_archive_user_created', 'user_id', 'created_at'),
+        # Monthly partitions are created by services/archive.py as orders are moved
+        {'postgresql_partition_by': 'RANGE (created_at)'},
+    )
+
+    # Completed orders moved out of the hot orders table (same columns).
+    # Postgres requires the partition key in the primary key.
+    id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    created_at = db.Column(db.DateTime, primary_key=True)
+    status = db.Column(db.String(20))
+    order_detail = db.Column(db.Text, nullable=False)
+    customer_name = db.Column(db.String(100))
+    customer_phone = db.Column(db.String(20))
+    address = db.Column(db.String(255))
+    updated_at = db.Column(db.DateTime)
+    user_id = db.Column(db.Integer) # No FK: history outlives deleted users
+    archived_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    def to_dict(self):
+        return dict(Order.to_dict(self), archived=True)
+
 class PushSubscription(db.Model):
     __tablename__ = 'push_subscriptions'
     
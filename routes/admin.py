@@ -1,11 +1,12 @@
 from flask import Blueprint, render_template, request, jsonify, current_app, redirect, url_for, flash
 from flask_login import login_required, current_user
-from extensions import db
-from models import User
+from extensions import db, tenant_router, menu_extractor, identity_cache
+from models import User, MenuJob, Order, PushSubscription
+from services.codecs import AUDIO_PROFILES
+from services.menu import replace_menu
 from werkzeug.security import generate_password_hash
-import base64
-import requests
-import json
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import undefer
 
 admin_bp = Blueprint('admin', __name__, url_prefix='/admin')
 
@@ -18,8 +19,10 @@ def admin_required():
 
 @admin_bp.route('/')
 def index():
-    users = User.query.all()
-    return render_template('admin.html', users=users)
+    # The edit dialogs need the prompt and menu of every user
+    users = User.query.options(undefer(User.system_prompt), undefer(User.menu)).all()
+    return render_template('admin.html', users=users, audio_profiles=AUDIO_PROFILES,
+                           default_audio_profile=current_app.config['DEFAULT_AUDIO_PROFILE'])
 
 @admin_bp.route('/users', methods=['POST'])
 def manage_user():
@@ -33,32 +36,61 @@ def manage_user():
         if User.query.filter_by(username=username).first():
             flash('Username already exists.')
         else:
-            user = User(username=username, phone_number=phone, company=company)
+            user = User(username=username, company=company)
+            user.set_phone(phone)
             user.set_password(password)
             user.is_admin = 'is_admin' in request.form
             db.session.add(user)
-            db.session.commit()
-            flash('User created.')
+            try:
+                db.session.commit()
+                tenant_router.invalidate()
+                flash('User created.')
+            except IntegrityError:
+                db.session.rollback()
+                flash('Phone number already used by another user.')
             
     elif action == 'edit':
         user_id = request.form.get('user_id')
         user = User.query.get(user_id)
         if user:
             user.voice = request.form.get('voice')
-            user.phone_number = request.form.get('phone')
+            audio_profile = request.form.get('audio_profile')
+            if audio_profile == '':
+                # Follow DEFAULT_AUDIO_PROFILE
+                user.audio_profile = None
+            elif audio_profile in AUDIO_PROFILES:
+                user.audio_profile = audio_profile
+            user.set_phone(request.form.get('phone'))
             user.agent_on = 'agent_on' in request.form
             user.system_prompt = request.form.get('system_prompt')
-            user.menu = request.form.get('menu')
-            db.session.commit()
-            flash('User updated.')
+            if request.form.get('menu') != user.menu:
+                replace_menu(user, request.form.get('menu'))
+            try:
+                db.session.commit()
+                tenant_router.invalidate()
+                identity_cache.invalidate(user.id)
+                flash('User updated.')
+            except IntegrityError:
+                db.session.rollback()
+                flash('Phone number already used by another user.')
 
     elif action == 'delete':
         user_id = request.form.get('user_id')
         user = User.query.get(user_id)
         if user:
+            # Explicit deletes so this also works where the FKs have no ON DELETE
+            Order.query.filter_by(user_id=user.id).delete(synchronize_session=False)
+            PushSubscription.query.filter_by(user_id=user.id).delete(synchronize_session=False)
             db.session.delete(user)
-            db.session.commit()
-            flash('User deleted.')
+            try:
+                db.session.commit()
+                tenant_router.invalidate()
+                identity_cache.invalidate(user.id)
+                flash('User deleted.')
+            except IntegrityError as e:
+                db.session.rollback()
+                current_app.logger.error(f"Could not delete user {user.id}: {e}")
+                flash('User could not be deleted: other records still reference it.')
             
     return redirect(url_for('admin.index'))
 
@@ -69,42 +101,19 @@ def upload_menu():
     if not user:
         return jsonify({'error': 'User not found'}), 404
 
-    image_file = request.files.get('menu_image')
-    if not image_file:
+    # One file per menu page
+    images = [f.read() for f in request.files.getlist('menu_image') if f]
+    if not images:
          return jsonify({'error': 'No image provided'}), 400
-         
-    # OpenAI Vision Logic
-    try:
-        image_data = base64.b64encode(image_file.read()).decode('utf-8')
-        
-        headers = {
-            "Content-Type": "application/json",
-            "Authorization": f"Bearer {current_app.config['OPENAI_API_KEY']}"
-        }
-        
-        payload = {
-            "model": "gpt-4o",
-            "messages": [
-                {
-                    "role": "user",
-                    "content": [
-                        {"type": "text", "text": "Extract strictly only the menu items and their prices from this image. output the result as a raw text list (Item: Price). Do NOT include any introductory text, markdown formatting (like ```), headers, footers, or any conversational filler. Just the data."},
-                        {"type": "image_url", "image_url": {"url": f"data:image/jpeg;base64,{image_data}"}}
-                    ]
-                }
-            ],
-            "max_tokens": 1000
-        }
-        
-        response = requests.post("https://api.openai.com/v1/chat/completions", headers=headers, json=payload)
-        response_data = response.json()
-        menu_text = response_data['choices'][0]['message']['content']
-        
-        user.menu = menu_text
-        db.session.commit()
-        
-        return jsonify({'success': True, 'menu_text': menu_text})
-        
-    except Exception as e:
-        current_app.logger.error(f"Vision API Error: {e}")
-        return jsonify({'error': str(e)}), 500
+
+    # Extraction runs in the background; the admin page polls menu_job
+    job_id = menu_extractor.submit(user.id, images)
+    return jsonify({'success': True, 'job_id': job_id,
+                    'status_url': url_for('admin.menu_job', job_id=job_id)}), 202
+
+@admin_bp.route('/menu/jobs/<job_id>')
+def menu_job(job_id):
+    job = MenuJob.query.get(job_id)
+    if not job:
+        return jsonify({'error': 'Job not found'}), 404
+    return jsonify(menu_extractor.expire_if_stale(job).to_dict())
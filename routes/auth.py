@@ -1,7 +1,8 @@
 from flask import Blueprint, render_template, redirect, url_for, flash, request
 from flask_login import login_user, logout_user, login_required
-from extensions import db
+from extensions import db, tenant_router
 from models import User
+from sqlalchemy.exc import IntegrityError
 
 auth_bp = Blueprint('auth', __name__)
 
@@ -53,13 +54,19 @@ def register():
     user = User(
         username=username,
         company=company,
-        phone_number=phone,
         system_prompt=current_app.config['DEFAULT_SYSTEM_PROMPT'],
         menu=""
     )
+    user.set_phone(phone)
     user.set_password(password)
     
     db.session.add(user)
-    db.session.commit()
+    try:
+        db.session.commit()
+    except IntegrityError:
+        # phone_e164 is unique: the number (once normalized) belongs to another user
+        db.session.rollback()
+        return {'error': 'Phone number already used by another user'}, 400
+    tenant_router.invalidate()
     
     return {'message': 'User created successfully'}, 201
@@ -0,0 +1,14 @@
+from flask import Blueprint, Response, abort, current_app, request
+from services import metrics
+
+metrics_bp = Blueprint('metrics', __name__)
+
+@metrics_bp.route('/metrics')
+def prometheus_metrics():
+    # Scrapers authenticate with a bearer token when METRICS_TOKEN is set
+    token = current_app.config.get('METRICS_TOKEN')
+    if token and request.headers.get('Authorization') != f"Bearer {token}":
+        abort(401)
+
+    body, content_type = metrics.render()
+    return Response(body, content_type=content_type)
@@ -1,9 +1,7 @@
 from flask import Blueprint, request, jsonify, current_app
 from flask_login import current_user, login_required
-from extensions import db
+from extensions import db, push_dispatcher
 from models import PushSubscription
-from pywebpush import webpush, WebPushException
-import json
 
 notifications_bp = Blueprint('notifications', __name__)
 
@@ -47,49 +45,11 @@ def subscribe():
     
     return jsonify({'status': 'success', 'message': 'Subscribed successfully.'}), 201
 
-def send_web_push(message_body):
+def send_web_push(message_body, coalesce_key=None, user_id=None):
     """
-    Helper to send push notification to all subscribers (or filtered ones).
-    For MVP, sending to ALL subscriptions.
+    Queue a push notification for user_id's subscriptions (all subscribers if None).
+    Returns immediately; delivery happens on the background dispatcher.
+    Messages sharing a coalesce_key that arrive close together are merged
+    into one summary push.
     """
-    subscriptions = PushSubscription.query.all()
-    
-    current_app.logger.info(f"Sending push to {len(subscriptions)} subscribers: {message_body}")
-    
-    if not subscriptions:
-        current_app.logger.warning("No push subscriptions found in database!")
-        return
-    
-    vapid_private = current_app.config.get('VAPID_PRIVATE_KEY')
-    vapid_public = current_app.config.get('VAPID_PUBLIC_KEY')
-    vapid_email = current_app.config.get('VAPID_CLAIM_EMAIL', 'mailto:admin@example.com')
-    
-    if not vapid_private or not vapid_public:
-        current_app.logger.error("VAPID keys not configured! Set VAPID_PRIVATE_KEY and VAPID_PUBLIC_KEY")
-        return
-    
-    vapid_claims = {"sub": vapid_email}
-    
-    success_count = 0
-    for sub in subscriptions:
-        try:
-            webpush(
-                subscription_info=sub.to_dict(),
-                data=json.dumps(message_body),
-                vapid_private_key=vapid_private,
-                vapid_claims=vapid_claims
-            )
-            success_count += 1
-            current_app.logger.info(f"Push sent to subscription ID {sub.id}")
-        except WebPushException as ex:
-            if ex.response and ex.response.status_code == 410:
-                # Expired subscription
-                current_app.logger.info(f"Removing expired subscription ID {sub.id}")
-                db.session.delete(sub)
-                db.session.commit()
-            else:
-                current_app.logger.error(f"WebPush Error for sub {sub.id}: {ex}")
-        except Exception as e:
-            current_app.logger.error(f"Push Error for sub {sub.id}: {e}")
-    
-    current_app.logger.info(f"Push complete: {success_count}/{len(subscriptions)} sent successfully")
+    push_dispatcher.enqueue(message_body, coalesce_key=coalesce_key, user_id=user_id)
@@ -1,63 +1,200 @@
+import csv
+import io
 import json
-import time
-from flask import Blueprint, render_template, request, jsonify, Response, stream_with_context, redirect, url_for, flash
+from flask import Blueprint, render_template, request, jsonify, Response, stream_with_context, redirect, url_for, flash, current_app
 from flask_login import login_required, current_user
-from extensions import db
+from extensions import db, event_bus, tenant_router, outbox_relay, identity_cache
 from datetime import datetime
-from models import Order
+from models import ArchivedOrder, Order, User
+from services import metrics, outbox
+from services.archive import order_history
+from sqlalchemy import select, union_all
+from sqlalchemy.orm import aliased
 
 orders_bp = Blueprint('orders', __name__)
 
-# Simple event queue for SSE
-# In production with multiple workers, use Redis/RabbitMQ. 
-# For this single worker setup, a global list or queue works.
-event_queue = []
+EXPORT_PAGE_SIZE = 500
+# Events carrying an order; they only reach the dashboard of the restaurant that owns it
+ORDER_EVENTS = frozenset(('new_order', 'order_updated', 'order_deleted'))
 
 def add_event(event_type, data):
-    event_queue.append({
-        'type': event_type,
-        'data': data,
-        'timestamp': time.time()
-    })
+    # Publishes through the configured backend (in-process or Postgres NOTIFY)
+    return event_bus.publish(event_type, data)
+
+def publish_order(event_type, order):
+    # SSE payloads carry the full order so dashboards can patch in place
+    add_event(event_type, order.to_dict())
+
+def tenant_orders():
+    return Order.query.filter_by(user_id=current_user.id)
+
+def newest_first(query):
+    return query.order_by(Order.created_at.desc(), Order.id.desc())
+
+def encode_cursor(order):
+    return f"{order.created_at.isoformat()}_{order.id}"
+
+def decode_cursor(cursor):
+    created_at, _, order_id = cursor.rpartition('_')
+    return datetime.fromisoformat(created_at), int(order_id)
 
 @orders_bp.route('/')
 @login_required
 def dashboard():
-    # Fetch orders by status
-    orders_recu = Order.query.filter_by(status='recu').order_by(Order.created_at.desc()).all()
-    orders_en_cours = Order.query.filter_by(status='en_cours').order_by(Order.created_at.desc()).all()
-    orders_termine = Order.query.filter_by(status='termine').order_by(Order.created_at.desc()).all()
+    # Taken before querying so the first delta poll overlaps, never skips
+    delta_cursor = datetime.utcnow().isoformat()
+    active_limit = current_app.config['DASHBOARD_ACTIVE_LIMIT']
+    page_size = current_app.config['DASHBOARD_DONE_PAGE_SIZE']
+
+    # One round trip: each status is an index range scan on
+    # (user_id, status, created_at) with its own LIMIT, glued with UNION ALL
+    columns = [('recu', active_limit), ('en_cours', active_limit), ('termine', page_size + 1)]
+    parts = [
+        select(newest_first(tenant_orders().filter_by(status=status)).limit(limit).subquery())
+        for status, limit in columns
+    ]
+    combined = aliased(Order, union_all(*parts).subquery())
+    rows = db.session.execute(select(combined)).scalars().all()
+
+    by_status = {status: [] for status, _ in columns}
+    for order in rows:
+        by_status[order.status].append(order)
+    for orders in by_status.values():
+        orders.sort(key=lambda o: (o.created_at, o.id), reverse=True)
+
+    orders_termine = by_status['termine'][:page_size]
+    has_more = len(by_status['termine']) > page_size
+    if orders_termine and not has_more:
+        # "Load older" continues into archived orders
+        has_more = db.session.query(ArchivedOrder.id).filter_by(user_id=current_user.id).first() is not None
     
     return render_template('dashboard.html', 
-                         orders_recu=orders_recu, 
-                         orders_en_cours=orders_en_cours, 
-                         orders_termine=orders_termine)
+                         orders_recu=by_status['recu'], 
+                         orders_en_cours=by_status['en_cours'], 
+                         orders_termine=orders_termine,
+                         termine_cursor=encode_cursor(orders_termine[-1]) if has_more else None,
+                         delta_cursor=delta_cursor)
+
+@orders_bp.route('/api/orders', methods=['GET'])
+@login_required
+def order_changes():
+    """
+    Delta feed for the dashboard: orders created or changed since the
+    cursor, plus the ids still in the active columns so the client can drop
+    cards deleted while it was disconnected.
+    """
+    since = request.args.get('since')
+    if not since:
+        # The dashboard page provides the first cursor; a full history is never sent here
+        return jsonify({'error': 'since is required'}), 400
+    try:
+        # >= so updates sharing the cursor timestamp are not lost;
+        # the client upserts, so repeats are harmless
+        query = tenant_orders().filter(Order.updated_at >= datetime.fromisoformat(since))
+    except ValueError:
+        return jsonify({'error': 'Invalid cursor'}), 400
+
+    limit = current_app.config['DASHBOARD_DELTA_LIMIT']
+    changed = query.order_by(Order.updated_at, Order.id).limit(limit + 1).all()
+    has_more = len(changed) > limit
+    changed = changed[:limit]
+    active_ids = [row.id for row in tenant_orders()
+                  .filter(Order.status.in_(['recu', 'en_cours']))
+                  .with_entities(Order.id)]
+
+    cursor = changed[-1].updated_at.isoformat() if changed else since
+    response = jsonify({
+        'orders': [order.to_dict() for order in changed],
+        'active_ids': active_ids,
+        'cursor': cursor,
+        'has_more': has_more
+    })
+    response.add_etag()
+    return response.make_conditional(request)
+
+@orders_bp.route('/api/orders/termine')
+@login_required
+def older_completed_orders():
+    """Keyset pagination for the completed column ("load older"), continuing into the archive."""
+    page_size = current_app.config['DASHBOARD_DONE_PAGE_SIZE']
+
+    before = request.args.get('before')
+    try:
+        before = decode_cursor(before) if before else None
+    except ValueError:
+        return jsonify({'error': 'Invalid cursor'}), 400
+
+    orders = order_history(current_user.id, status='termine', before=before, limit=page_size + 1)
+    has_more = len(orders) > page_size
+    orders = orders[:page_size]
+
+    return jsonify({
+        'orders': [order.to_dict() for order in orders],
+        'next_cursor': encode_cursor(orders[-1]) if has_more else None
+    })
+
+@orders_bp.route('/api/orders/export')
+@login_required
+def export_orders():
+    """CSV of the tenant's orders (hot and archived), optionally bounded by ?from=&to= dates."""
+    try:
+        since = datetime.fromisoformat(request.args['from']) if request.args.get('from') else None
+        until = datetime.fromisoformat(request.args['to']) if request.args.get('to') else None
+    except ValueError:
+        return jsonify({'error': 'Invalid date'}), 400
+    user_id = current_user.id
+    columns = ['id', 'created_at', 'status', 'customer_name', 'customer_phone', 'address', 'order_detail', 'archived']
+
+    def generate():
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        writer.writerow(columns)
+        before = None
+        # Page through by keyset so large exports never load everything at once
+        while True:
+            orders = order_history(user_id, before=before, since=since, until=until, limit=EXPORT_PAGE_SIZE)
+            for order in orders:
+                row = order.to_dict()
+                writer.writerow([row['id'], row['created_at'], row['status'], row['customer_name'],
+                                 row['customer_phone'], row['address'], row['order_detail'], row.get('archived', False)])
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+            if len(orders) < EXPORT_PAGE_SIZE:
+                break
+            before = (orders[-1].created_at, orders[-1].id)
+
+    return Response(stream_with_context(generate()), mimetype='text/csv',
+                    headers={'Content-Disposition': 'attachment; filename=orders.csv'})
 
 @orders_bp.route('/api/orders/<int:order_id>/status', methods=['POST'])
 @login_required
 def update_status(order_id):
-    order = Order.query.get_or_404(order_id)
+    order = tenant_orders().filter_by(id=order_id).first_or_404()
     new_status = request.json.get('status')
     
     if new_status in ['recu', 'en_cours', 'termine']:
         order.status = new_status
         db.session.commit()
-        return jsonify({'success': True, 'status': new_status})
+        publish_order('order_updated', order)
+        return jsonify({'success': True, 'status': new_status, 'order': order.to_dict()})
         
     return jsonify({'error': 'Invalid status'}), 400
 
 @orders_bp.route('/api/orders/<int:order_id>', methods=['DELETE'])
 @login_required
 def delete_order(order_id):
-    order = Order.query.get_or_404(order_id)
+    order = tenant_orders().filter_by(id=order_id).first_or_404()
+    deleted = {'id': order.id, 'user_id': order.user_id}
     db.session.delete(order)
     db.session.commit()
+    add_event('order_deleted', deleted)
     return jsonify({'success': True})
 
 @orders_bp.route('/api/orders/<int:order_id>', methods=['PUT'])
 @login_required
 def edit_order(order_id):
-    order = Order.query.get_or_404(order_id)
+    order = tenant_orders().filter_by(id=order_id).first_or_404()
     data = request.json
     
     if 'order_detail' in data:
@@ -70,13 +207,17 @@ def edit_order(order_id):
         order.address = data['address']
         
     db.session.commit()
-    return jsonify({'success': True})
+    publish_order('order_updated', order)
+    return jsonify({'success': True, 'order': order.to_dict()})
 
 @orders_bp.route('/toggle_agent', methods=['POST'])
 @login_required
 def toggle_agent():
-    current_user.agent_on = not current_user.agent_on
+    # current_user is a cached snapshot, so update the row directly
+    User.query.filter_by(id=current_user.id).update({'agent_on': not current_user.agent_on})
     db.session.commit()
+    identity_cache.invalidate(current_user.id)
+    tenant_router.invalidate()
     # status = "ON" if current_user.agent_on else "OFF"
     # flash(f"Agent turned {status}") 
     return redirect(url_for('orders.dashboard'))
@@ -84,53 +225,77 @@ def toggle_agent():
 @orders_bp.route('/events')
 @login_required
 def events():
+    # Resume from the browser's Last-Event-ID when it reconnects
+    raw_last_id = request.headers.get('Last-Event-ID')
+    last_id = event_bus.parse_id(raw_last_id)
+    tenant_id = current_user.id
+
     @stream_with_context
     def generate():
-        last_check = time.time()
-        while True:
-            # Check for new events since last check
-            # This is a very basic polling implementation for SSE within the generator
-            # Ideally use a queue or threading event
-            
-            # Filter events that happened after last_check
-            current_events = [e for e in event_queue if e['timestamp'] > last_check]
-            
-            for event in current_events:
-                yield f"data: {json.dumps(event)}\n\n"
-            
-            if current_events:
-                last_check = current_events[-1]['timestamp']
-            
-            time.sleep(1) # Heartbeat / Poll interval
-            
-    return Response(generate(), mimetype='text/event-stream')
-
-# Public endpoint to create orders (simulating external system or manual entry for testing)
-# This will be called by the Voice Agent logic too
+        cursor = last_id
+        yield "retry: 3000\n\n"
+
+        if cursor is None:
+            # Fresh connection (or id from another process): start at the tip
+            cursor = event_bus.last_id
+            if raw_last_id:
+                yield format_sse({'type': 'resync', 'data': {}}, event_bus.format_id(cursor))
+
+        metrics.SSE_STREAMS.inc()
+        try:
+            while True:
+                if not event_bus.wait(cursor, event_bus.keepalive_seconds):
+                    # Comment line keeps proxies from closing an idle stream
+                    yield ": keep-alive\n\n"
+                    continue
+
+                pending, complete = event_bus.since(cursor)
+                metrics.SSE_BACKLOG_EVENTS.observe(len(pending))
+                if not complete:
+                    yield format_sse({'type': 'resync', 'data': {}}, event_bus.format_id(pending[0]['id'] - 1))
+
+                for event in pending:
+                    cursor = event['id']
+                    # Orders without an owner (calls to unrouted numbers) go to nobody
+                    if event['type'] in ORDER_EVENTS and (event['data'] or {}).get('user_id') != tenant_id:
+                        continue
+                    yield format_sse(event, event_bus.format_id(cursor))
+        finally:
+            metrics.SSE_STREAMS.dec()
+
+    response = Response(generate(), mimetype='text/event-stream')
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
+
+def format_sse(event, event_id):
+    return f"id: {event_id}\ndata: {json.dumps(event)}\n\n"
+
+# Manual order entry from the dashboard; call orders go through services/order_ingest.py.
+# The tenant always comes from the session, never from the request body
 @orders_bp.route('/api/orders', methods=['POST'])
+@login_required
 def create_order():
-    data = request.json
+    data = request.get_json(silent=True) or {}
+    if not data.get('order_detail'):
+        return jsonify({'error': 'order_detail is required'}), 400
     order = Order(
         order_detail=data.get('order_detail'),
         customer_name=data.get('customer_name'),
         customer_phone=data.get('customer_phone'),
         address=data.get('address'),
-        status='recu'
+        status='recu',
+        user_id=current_user.id
     )
     db.session.add(order)
+    db.session.flush()
+
+    # SSE event and Web Push commit with the order and are sent by the outbox relay
+    outbox.record('new_order', order.to_dict(), push={
+        "title": "Ordre reçus",
+        "message": f"{data.get('customer_name')} : {data.get('order_detail')}"
+    }, coalesce_key='new_order', user_id=order.user_id)
     db.session.commit()
-    
-    # Trigger Web Push
-    try:
-        from routes.notifications import send_web_push
-        send_web_push({
-            "title": "Ordre reçus",
-            "message": f"{data.get('customer_name')} : {data.get('order_detail')}"
-        })
-    except Exception as e:
-        current_app.logger.error(f"Push Error: {e}")
-
-    # Trigger SSE
-    add_event('new_order', {'message': 'Ordre reçu'})
-    
+    outbox_relay.wake()
+
     return jsonify(order.to_dict()), 201
@@ -1,6 +1,8 @@
 from flask import Blueprint, jsonify, current_app
+from flask_login import current_user
 from routes.notifications import send_web_push
 from models import PushSubscription
+from extensions import push_dispatcher, order_ingest, outbox_relay
 
 test_bp = Blueprint('test', __name__)
 
@@ -10,8 +12,8 @@ def test_push():
         send_web_push({
             "title": "Test Notification",
             "message": "Ceci est un test de notification Web Push !"
-        })
-        return jsonify({"success": True, "message": "Notification envoyée"})
+        }, user_id=current_user.id if current_user.is_authenticated else None)
+        return jsonify({"success": True, "message": "Notification en file d'envoi"})
     except Exception as e:
         return jsonify({"success": False, "error": str(e)}), 500
 
@@ -27,5 +29,9 @@ def push_debug():
         "subscriptions": [{"id": s.id, "endpoint_preview": s.endpoint[:50] + "..."} for s in subs],
         "vapid_public_key_set": bool(vapid_public),
         "vapid_private_key_set": bool(vapid_private),
-        "vapid_public_key": vapid_public[:20] + "..." if vapid_public else None
+        "vapid_public_key": vapid_public[:20] + "..." if vapid_public else None,
+        "dispatcher": dict(push_dispatcher.stats, queue_depth=push_dispatcher.queue_depth),
+        "vapid_cache": push_dispatcher.vapid_cache.stats if push_dispatcher.vapid_cache else None,
+        "order_ingest": dict(order_ingest.stats, queue_depth=order_ingest.queue_depth),
+        "outbox": outbox_relay.stats
     })
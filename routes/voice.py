@@ -1,16 +1,17 @@
-import json
-import base64
-import threading
-import websocket
-import os
+import time
 from flask import Blueprint, request, jsonify, current_app
-from extensions import sock, db
-from models import User, Order
-from routes.orders import add_event
+from extensions import sock, tenant_router, warm_pool, order_ingest
+from services.realtime_session import session_cache
+from services.menu import menu_catalog
+from services.realtime_pool import connect_realtime
+from services.call_session import CallSession
+from services.codecs import get_profile
+from services import metrics
 
 voice_bp = Blueprint('voice', __name__)
 
-OPENAI_WS_URL = "wss://api.openai.com/v1/realtime?model=gpt-realtime"
+def resolve_profile(tenant):
+    return get_profile((tenant and tenant['audio_profile']) or current_app.config['DEFAULT_AUDIO_PROFILE'])
 
 @voice_bp.route('/webhooks/event', methods=['POST'])
 def event():
@@ -39,7 +40,14 @@ def answer_call():
     if 'fly.dev' in host:
         scheme = 'wss'
 
-    ws_uri = f"{scheme}://{host}/voice/stream?to_number={to_number}&caller_number={from_number}"
+    # Start the OpenAI handshake now, while Vonage connects its WebSocket to us
+    call_token = warm_pool.new_token()
+    tenant = tenant_router.resolve(to_number)
+    profile = resolve_profile(tenant)
+    if not tenant or tenant['agent_on']:
+        warm_pool.start(call_token, session_cache.get(tenant, profile))
+
+    ws_uri = f"{scheme}://{host}/voice/stream?to_number={to_number}&caller_number={from_number}&call_token={call_token}"
     
     current_app.logger.info(f"Generating NCCO with WebSocket URI: {ws_uri}")
     
@@ -50,7 +58,7 @@ def answer_call():
             "endpoint": [{
                 "type": "websocket",
                 "uri": ws_uri,
-                "content-type": "audio/l16;rate=24000",
+                "content-type": profile.content_type,
                 "headers": {
                     "to-number": to_number,
                     "caller-number": from_number
@@ -62,7 +70,7 @@ def answer_call():
 @sock.route('/voice/stream')
 def voice_stream(ws):
     """
-    Sync implementation using threads/gevent and websocket-client.
+    Bridges the Vonage call to an OpenAI realtime session (see CallSession).
     """
     # Accept header with hyphens or underscores, or query param
     to_number = request.args.get('to_number') or request.headers.get('to-number') or request.headers.get('to_number')
@@ -71,255 +79,74 @@ def voice_stream(ws):
     # Urgent Log
     print(f"DEBUG PRINT: Incoming call to {to_number} from {caller_number}", flush=True)
     current_app.logger.info(f"Incoming call to: {to_number} (Caller: {caller_number})")
-    # 1. Fetch Context
-    # Normalize query: Try exact match first, then with '+' if missing, or without '+' if present
-    user = User.query.filter_by(phone_number=to_number).first()
-    if not user and to_number:
-        # Try alternatives
-        if to_number.startswith('+'):
-            user = User.query.filter_by(phone_number=to_number[1:]).first()
-        else:
-            user = User.query.filter_by(phone_number=f"+{to_number}").first()
+    # 1. Fetch Context (in-process routing cache, no DB round trip once warm)
+    tenant = tenant_router.resolve(to_number)
     
-    current_app.logger.info(f"Incoming call to: {to_number} (Matched User: {user.username if user else 'None'})")
+    current_app.logger.info(f"Incoming call to: {to_number} (Matched User: {tenant['username'] if tenant else 'None'})")
 
     # Allow calls for a phone number only if agent is set to on
-    if user and not user.agent_on:
+    if tenant and not tenant['agent_on']:
         current_app.logger.info(f"Call rejected: Agent Off for {to_number}")
         ws.close()
         return
 
-    system_instruction = "You are a helpful AI assistant taking food orders."
-    voice_api = 'sage' # Default
-    
-    if user:
-        if user.system_prompt:
-             system_instruction = user.system_prompt
-        if user.menu:
-             system_instruction += f"\n\nHere is the Menu:\n{user.menu}"
-        if user.voice:
-             voice_api = user.voice
-    
-    system_instruction += "\n\nWhen the order is confirmed, you MUST use the 'create_order_tool' to submit it. Ask for name and address if missing."
-
-    # 2. Connect to OpenAI
-    api_key = current_app.config['OPENAI_API_KEY']
-    # websocket-client accepts list of strings for headers
-    headers = [
-        f"Authorization: Bearer {api_key}",
-        "OpenAI-Beta: realtime=v1"
-    ]
-    
-    try:
-        openai_ws = websocket.create_connection(OPENAI_WS_URL, header=headers)
-    except Exception as e:
-        current_app.logger.error(f"Failed to connect to OpenAI: {e}")
-        return
-
-    try:
-        # Initialize Session
-        # CRITICAL: Use g711_ulaw for telephony (Vonage) - it handles sample rate conversion automatically
-        # Alternative: Keep pcm16 but Vonage must be configured for 24kHz (not standard)
-        session_update = {
-            "type": "session.update",
-            "session": {
-                "modalities": ["text", "audio"],
-                "instructions": system_instruction,
-                "voice": voice_api,
-                "input_audio_format": "pcm16",      # 24kHz raw audio
-                "output_audio_format": "pcm16",     # 24kHz raw audio
-                "input_audio_transcription": {       # Enable for better speech recognition
-                    "model": "whisper-1"
-                },
-                "turn_detection": {
-                    "type": "server_vad",
-                    "threshold": 0.5,
-                    "prefix_padding_ms": 200,
-                    "silence_duration_ms": 400
-                },
-                "tools": [
-                {
-                    "type": "function",
-                    "name": "create_order_tool",
-                    "description": "Submit a completed restaurant order after the customer confirms all details.",
-                    "parameters": {
-                    "type": "object",
-                    "properties": {
-                        "order_details": {
-                        "type": "string",
-                        "description": "Full list of ordered items with quantities and options (size, sauce, drink, extras)."
-                        },
-                        "customer_name": {
-                        "type": "string",
-                        "description": "Customer's full name as spoken by the caller. Ask to repeat or spell if unclear."
-                        },
-                        "customer_address": {
-                        "type": "string",
-                        "description": "Complete delivery address including city, neighborhood, street, building, and apartment if provided."
-                        }
-                    },
-                        "required": ["order_details"]
-                    }
-                }]
-            }
-        }
-        current_app.logger.info(f"OpenAI Session Update: Voice={voice_api}, Instructions_Len={len(system_instruction)}")
-        openai_ws.send(json.dumps(session_update))
+    tenant_id = tenant['id'] if tenant else None
 
-        # Capture app object for thread context
-        app = current_app._get_current_object()
+    # Precompiled per tenant; rebuilt only when prompt, menu, voice or tools change
+    profile = resolve_profile(tenant)
+    session = session_cache.get(tenant, profile)
 
-        # Thread 1: Vonage -> OpenAI
-        def vonage_to_openai():
-            with app.app_context():
-                try:
-                    while True:
-                        data = ws.receive()
-                        if not data:
-                            current_app.logger.info("Vonage WebSocket closed (empty data)")
-                            break
-                        
-                        if isinstance(data, bytes):
-                            audio_b64 = base64.b64encode(data).decode('utf-8')
-                            event = {
-                                "type": "input_audio_buffer.append",
-                                "audio": audio_b64
-                            }
-                            openai_ws.send(json.dumps(event))
-                        else:
-                            current_app.logger.debug(f"Received non-byte data from Vonage: {data}")
-                except Exception as e:
-                    # Check for normal closure code 1000 or 1001 inside string representation if exception class unavailable
-                    if "1000" in str(e) or "1001" in str(e):
-                         current_app.logger.info("Vonage Call Ended (Normal Closure)")
-                    else:
-                        current_app.logger.error(f"Vonage -> OpenAI Error: {e}")
-                finally:
-                    try:
-                        openai_ws.close()
-                    except:
-                        pass
-
-        # Thread 2: OpenAI -> Vonage
-        def openai_to_vonage():
-            with app.app_context():
-                try:
-                    while True:
-                        try:
-                            msg = openai_ws.recv()
-                        except websocket.WebSocketConnectionClosedException:
-                            current_app.logger.info("OpenAI WebSocket closed")
-                            break
-                            
-                        if not msg:
-                            break
-                        
-                        event = json.loads(msg)
-                        event_type = event.get('type')
-                        
-                        # Handle Interruption: Cancel OpenAI's current response
-                        if event_type == 'input_audio_buffer.speech_started':
-                             current_app.logger.info("User interruption detected - Cancelling OpenAI response")
-                             # Tell OpenAI to stop generating the current response
-                             try:
-                                 cancel_event = {"type": "response.cancel"}
-                                 openai_ws.send(json.dumps(cancel_event))
-                             except Exception as cancel_e:
-                                 current_app.logger.warning(f"Failed to send response.cancel: {cancel_e}")
-                        
-                        # Log meaningful events (ignore frequent audio deltas to reduce noise)
-                        # if event_type not in ['response.audio.delta', 'response.audio_transcript.delta']:
-                        #    current_app.logger.info(f"OpenAI Event: {event_type}")
-
-                        if event_type == 'response.audio.delta':
-                            audio_b64 = event.get('delta')
-                            if audio_b64:
-                                audio_bytes = base64.b64decode(audio_b64)
-                                try:
-                                    ws.send(audio_bytes)
-                                except Exception as send_e:
-                                    # If Vonage closed, we might fail to send
-                                    if "1000" in str(send_e) or "1001" in str(send_e):
-                                        break
-                                    raise send_e
-                        
-                        elif event_type == 'response.function_call_arguments.done':
-                            call_id = event.get('call_id')
-                            args_str = event.get('arguments')
-                            name = event.get('name')
-                            
-                            if name == 'create_order_tool':
-                                args = json.loads(args_str)
-                                current_app.logger.info(f"Creating Order: {args}")
-                                
-                                try:
-                                    # Create Order
-                                    with current_app.app_context():
-                                        new_order = Order(
-                                            status='recu',
-                                            order_detail=args.get('order_details'),
-                                            customer_name=args.get('customer_name', 'Unknown'),
-                                            customer_phone=caller_number or 'Unknown',
-                                            address=args.get('customer_address', 'Pickup')
-                                        )
-                                        db.session.add(new_order)
-                                        db.session.commit()
-                                        
-                                        # Output
-                                        order_id = new_order.id
-                                        add_event('new_order', {'message': 'Ordre reçu'})
-                                        
-                                        # Send Push Notification
-                                        try:
-                                            from routes.notifications import send_web_push
-                                            send_web_push({
-                                                "title": "Ordre reçus",
-                                                "message": f"{args.get('customer_name', 'Client')} : {args.get('order_details', 'Nouvelle commande')}"
-                                            })
-                                        except Exception as push_e:
-                                            current_app.logger.error(f"Push notification error: {push_e}")
-
-                                    # Send Output
-                                    output_event = {
-                                        "type": "conversation.item.create",
-                                        "item": {
-                                            "type": "function_call_output",
-                                            "call_id": call_id,
-                                            "output": json.dumps({"status": "success", "order_id": order_id})
-                                        }
-                                    }
-                                    openai_ws.send(json.dumps(output_event))
-                                    openai_ws.send(json.dumps({"type": "response.create"}))
-                                    
-                                except Exception as db_e:
-                                    current_app.logger.error(f"DB Error: {db_e}")
-
-                except Exception as e:
-                    if "1000" in str(e) or "1001" in str(e):
-                        current_app.logger.info("OpenAI -> Vonage loop ended (Client disconnected)")
-                    else:
-                        current_app.logger.error(f"OpenAI -> Vonage Error: {e}")
-                finally:
-                    try:
-                        # Closing downstream
-                        ws.close()
-                    except:
-                        pass
-
-        t1 = threading.Thread(target=vonage_to_openai)
-        t2 = threading.Thread(target=openai_to_vonage)
-        
-        t1.start()
-        t2.start()
-        
-        # Keep the main handler alive until threads finish
-        t1.join()
-        t2.join()
+    # 2. Connect to OpenAI (pre-warmed at /webhooks/answer when possible)
+    call_started = time.monotonic()
+    openai_ws, answered_at = warm_pool.claim(request.args.get('call_token'))
+    warm = openai_ws is not None
 
+    if not warm:
+        try:
+            openai_ws = connect_realtime(current_app.config['OPENAI_API_KEY'], session, warm_pool.url)
+        except Exception as e:
+            current_app.logger.error(f"Failed to connect to OpenAI: {e}")
+            metrics.CALL_ERRORS.labels(stage='connect').inc()
+            return
+
+    current_app.logger.info(
+        f"OpenAI Session Ready: warm={warm}, Voice={session.voice}, Instructions_Len={session.instructions_len}, "
+        f"connect_ms={(time.monotonic() - call_started) * 1000:.0f}"
+    )
+    # Setup and time to first audio count from the answer webhook when we have it
+    started_at = answered_at or call_started
+    warm_label = 'true' if warm else 'false'
+    metrics.CALL_SETUP_SECONDS.labels(warm=warm_label).observe(time.monotonic() - started_at)
+
+    def on_first_audio(ttfa_ms):
+        warm_pool.record_first_audio(warm, ttfa_ms)
+        metrics.FIRST_AUDIO_SECONDS.labels(warm=warm_label).observe(ttfa_ms / 1000)
+        current_app.logger.info(f"Time to first audio: {ttfa_ms:.0f}ms (warm={warm})")
+
+    def create_order_tool(args):
+        current_app.logger.info(f"Creating Order: {args}")
+        # Committed off the call loop; the model is answered once the commit returns
+        return order_ingest.submit({
+            'order_detail': args.get('order_details'),
+            'customer_name': args.get('customer_name', 'Unknown'),
+            'customer_phone': caller_number or 'Unknown',
+            'address': args.get('customer_address', 'Pickup'),
+            'user_id': tenant_id
+        }, push={
+            "title": "Ordre reçus",
+            "message": f"{args.get('customer_name', 'Client')} : {args.get('order_details', 'Nouvelle commande')}"
+        })
+
+    # Both sockets are served from this greenlet until either side hangs up
+    call = CallSession(ws, openai_ws, profile, current_app.config,
+                       tools={'create_order_tool': create_order_tool,
+                              'lookup_menu': lambda args: menu_catalog.lookup(tenant, args.get('query', ''))},
+                       on_first_audio=on_first_audio,
+                       started_at=started_at)
+    try:
+        call.run()
     except Exception as e:
         current_app.logger.error(f"Voice Stream Error: {e}")
+        metrics.CALL_ERRORS.labels(stage='stream').inc()
     finally:
-        try:
-            openai_ws.close()
-        except:
-            pass
+        current_app.logger.info(f"Call ended: {call.summary()}")
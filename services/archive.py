@@ -0,0 +1,145 @@
+import logging
+import time
+from datetime import datetime, timedelta
+
+from sqlalchemy import delete, insert, literal, select, text, tuple_
+
+logger = logging.getLogger(__name__)
+
+# Columns copied from orders to orders_archive (archived_at is added on insert)
+ARCHIVED_COLUMNS = ('id', 'status', 'order_detail', 'customer_name', 'customer_phone', 'address',
+                    'created_at', 'updated_at', 'user_id')
+
+
+def month_start(moment):
+    return moment.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+
+
+def next_month(moment):
+    moment = month_start(moment)
+    return moment.replace(year=moment.year + 1, month=1) if moment.month == 12 else moment.replace(month=moment.month + 1)
+
+
+class OrderArchiver:
+    """
+    Moves completed orders older than a cutoff out of the hot orders table
+    into orders_archive, which Postgres partitions by month of created_at.
+
+    Work is done in batches of batch_size, each its own short transaction:
+    rows are claimed with FOR UPDATE SKIP LOCKED, copied with INSERT ...
+    SELECT and deleted, so the hot table is never locked for long and a
+    dashboard update to a claimed order just waits for one batch. Batches
+    are spaced by pause seconds to leave the DB to live traffic. Monthly
+    partitions are created before the first batch that needs them.
+    """
+
+    def __init__(self, batch_size=1000, pause=0.1):
+        self.batch_size = batch_size
+        self.pause = pause
+        self.stats = {'archived': 0, 'batches': 0}
+
+    def run(self, older_than_days, max_batches=None):
+        """Archive completed orders older than older_than_days. Needs an app context. Returns the number moved."""
+        from extensions import db
+        from models import Order
+
+        cutoff = datetime.utcnow() - timedelta(days=older_than_days)
+        oldest = db.session.query(db.func.min(Order.created_at)) \
+            .filter(Order.status == 'termine', Order.created_at < cutoff).scalar()
+        db.session.rollback()
+        if oldest is None:
+            return 0
+        self.ensure_partitions(oldest, cutoff)
+
+        moved = 0
+        batches = 0
+        while max_batches is None or batches < max_batches:
+            count = self.archive_batch(cutoff)
+            if not count:
+                break
+            moved += count
+            batches += 1
+            if count < self.batch_size:
+                break
+            time.sleep(self.pause)
+
+        logger.info(f"Archived {moved} orders created before {cutoff.isoformat()} in {batches} batches")
+        return moved
+
+    def archive_batch(self, cutoff):
+        """Move up to batch_size completed orders created before cutoff. Returns the number moved."""
+        from extensions import db
+        from models import ArchivedOrder, Order
+
+        ids = [row.id for row in db.session.query(Order.id)
+               .filter(Order.status == 'termine', Order.created_at < cutoff)
+               .order_by(Order.created_at, Order.id)
+               .limit(self.batch_size).with_for_update(skip_locked=True)]
+        if not ids:
+            db.session.rollback()
+            return 0
+
+        orders = Order.__table__
+        try:
+            db.session.execute(insert(ArchivedOrder.__table__).from_select(
+                ARCHIVED_COLUMNS + ('archived_at',),
+                select(*[orders.c[name] for name in ARCHIVED_COLUMNS], literal(datetime.utcnow()))
+                .where(orders.c.id.in_(ids))
+            ))
+            db.session.execute(delete(orders).where(orders.c.id.in_(ids)))
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
+
+        self.stats['archived'] += len(ids)
+        self.stats['batches'] += 1
+        return len(ids)
+
+    def ensure_partitions(self, start, end):
+        """Create the monthly orders_archive partitions covering [start, end] (Postgres only)."""
+        from extensions import db
+
+        if db.engine.dialect.name != 'postgresql':
+            return
+        month = month_start(start)
+        while month <= end:
+            following = next_month(month)
+            db.session.execute(text(
+                f"CREATE TABLE IF NOT EXISTS orders_archive_{month:%Y_%m} PARTITION OF orders_archive "
+                f"FOR VALUES FROM ('{month:%Y-%m-%d}') TO ('{following:%Y-%m-%d}')"
+            ))
+            month = following
+        db.session.commit()
+
+
+def order_history(user_id, status=None, before=None, since=None, until=None, limit=None):
+    """
+    A tenant's orders, newest first, across the hot table and the archive.
+
+    before is a (created_at, id) keyset position; since/until bound
+    created_at, which lets Postgres skip archive partitions outside the
+    range. Each table is read with its own LIMIT and the two sorted runs
+    are merged, so a page costs two index range scans. Returns Order and
+    ArchivedOrder rows (both have to_dict()).
+    """
+    from models import ArchivedOrder, Order
+
+    runs = []
+    for model in (Order, ArchivedOrder):
+        query = model.query.filter(model.user_id == user_id)
+        if status:
+            query = query.filter(model.status == status)
+        if since:
+            query = query.filter(model.created_at >= since)
+        if until:
+            query = query.filter(model.created_at < until)
+        if before:
+            query = query.filter(tuple_(model.created_at, model.id) < tuple_(*before))
+        query = query.order_by(model.created_at.desc(), model.id.desc())
+        if limit is not None:
+            query = query.limit(limit)
+        runs.extend(query.all())
+
+    runs.sort(key=lambda order: (order.created_at, order.id), reverse=True)
+    return runs[:limit] if limit is not None else runs
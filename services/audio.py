@@ -0,0 +1,235 @@
+import base64
+import logging
+import time
+from collections import deque
+
+import gevent
+from gevent.event import Event
+from websocket import ABNF
+
+logger = logging.getLogger(__name__)
+
+# Defaults for the l16_24k profile: 16-bit mono PCM at 24kHz on both legs
+SAMPLE_RATE = 24000
+BYTES_PER_MS = SAMPLE_RATE * 2 // 1000
+
+
+class UplinkAggregator:
+    """
+    Batches inbound Vonage audio frames into fewer input_audio_buffer.append
+    messages.
+
+    Frames are copied into one preallocated buffer and flushed once it holds
+    flush_ms of audio (or on demand, e.g. at end of speech). The JSON
+    envelope is a fixed byte prefix/suffix around the base64 audio, so no
+    dict is built or serialized per message.
+    """
+
+    PREFIX = b'{"type":"input_audio_buffer.append","audio":"'
+    SUFFIX = b'"}'
+
+    def __init__(self, send, flush_ms=80, bytes_per_ms=BYTES_PER_MS):
+        self.send = send
+        self.bytes_per_ms = bytes_per_ms
+        self.flush_bytes = max(1, int(flush_ms * bytes_per_ms))
+        self._buffer = bytearray(self.flush_bytes)
+        self._view = memoryview(self._buffer)
+        self._length = 0
+        self.stats = {
+            'frames': 0,
+            'messages': 0,
+            'bytes': 0,
+            'processing_s': 0.0,
+        }
+
+    def add(self, frame):
+        started = time.perf_counter()
+        self.stats['frames'] += 1
+        self.stats['bytes'] += len(frame)
+
+        offset = 0
+        while offset < len(frame):
+            chunk = min(len(frame) - offset, self.flush_bytes - self._length)
+            self._view[self._length:self._length + chunk] = frame[offset:offset + chunk]
+            self._length += chunk
+            offset += chunk
+            if self._length == self.flush_bytes:
+                self._flush()
+
+        self.stats['processing_s'] += time.perf_counter() - started
+
+    def flush(self):
+        started = time.perf_counter()
+        if self._length:
+            self._flush()
+        self.stats['processing_s'] += time.perf_counter() - started
+
+    def _flush(self):
+        message = self.PREFIX + base64.b64encode(self._view[:self._length]) + self.SUFFIX
+        self._length = 0
+        self.stats['messages'] += 1
+        # websocket-client sends bytes as-is in a text frame
+        self.send(message, ABNF.OPCODE_TEXT)
+
+    def summary(self):
+        audio_s = self.stats['bytes'] / (self.bytes_per_ms * 1000)
+        cpu_ms_per_audio_s = (self.stats['processing_s'] * 1000 / audio_s) if audio_s else 0
+        return (f"uplink frames={self.stats['frames']} messages={self.stats['messages']} "
+                f"audio_s={audio_s:.1f} cpu_ms_per_audio_s={cpu_ms_per_audio_s:.3f}")
+
+
+class DownlinkPacer:
+    """
+    Re-chunks OpenAI output audio into exact frame_ms PCM frames and sends
+    them to Vonage on a real-time clock.
+
+    OpenAI delivers audio in bursts much faster than real time; pushing it
+    straight to the telephony socket makes the far end buffer and jitter.
+    Frames are queued here and a pacing greenlet sends one per frame_ms.
+    Playback only starts once prebuffer_frames are queued (a small jitter
+    buffer), and running dry mid-response is counted as an underrun.
+
+    Each frame remembers the assistant item it belongs to, so on barge-in
+    interrupt() can drop everything still queued and report how much of the
+    item the caller actually heard.
+    """
+
+    def __init__(self, send, frame_ms=20, bytes_per_ms=BYTES_PER_MS, prebuffer_frames=3):
+        self.send = send
+        self.frame_ms = frame_ms
+        self.frame_s = frame_ms / 1000
+        self.frame_bytes = frame_ms * bytes_per_ms
+        self.prebuffer_frames = prebuffer_frames
+        self._frames = deque()
+        self._partial = bytearray()
+        self._partial_item = None
+        self._last_item = None
+        self._played_ms = {}
+        self._cancelled = set()
+        self._response_done = False
+        self._ready = Event()
+        self._greenlet = None
+        self._stopped = False
+        self.stats = {
+            'frames': 0,
+            'underruns': 0,
+            'late_frames': 0,
+            'max_queue_depth': 0,
+            'interruptions': 0,
+            'dropped_frames': 0,
+        }
+
+    @property
+    def queue_depth(self):
+        return len(self._frames)
+
+    def start(self):
+        self._greenlet = gevent.spawn(self._run)
+
+    def stop(self):
+        self._stopped = True
+        self._ready.set()
+
+    def push(self, pcm, item_id=None, content_index=0):
+        if item_id in self._cancelled:
+            # Late deltas for a response the caller already interrupted
+            return
+
+        item = (item_id, content_index)
+        if self._partial and self._partial_item != item:
+            self._pad_partial()
+        self._partial_item = item
+        self._last_item = item
+        self._response_done = False
+
+        self._partial += pcm
+        cut = len(self._partial) - len(self._partial) % self.frame_bytes
+        for offset in range(0, cut, self.frame_bytes):
+            self._frames.append((item, bytes(self._partial[offset:offset + self.frame_bytes])))
+        del self._partial[:cut]
+
+        self.stats['max_queue_depth'] = max(self.stats['max_queue_depth'], len(self._frames))
+        self._ready.set()
+
+    def end_of_response(self):
+        """Pad the last partial frame with silence and let it play out."""
+        self._pad_partial()
+        self._response_done = True
+        self._ready.set()
+
+    def interrupt(self):
+        """
+        Drop all queued audio. Returns (item_id, content_index, played_ms)
+        for the assistant item that was cut off, or None if nothing was
+        playing.
+        """
+        if self._frames:
+            item = self._frames[0][0]
+        elif self._partial or not self._response_done:
+            item = self._last_item
+        else:
+            item = None
+
+        self.stats['dropped_frames'] += len(self._frames)
+        self._frames.clear()
+        self._partial.clear()
+        self._response_done = True
+
+        if item is None or item[0] is None:
+            return None
+        self.stats['interruptions'] += 1
+        self._cancelled.add(item[0])
+        return item[0], item[1], self._played_ms.get(item[0], 0)
+
+    def _pad_partial(self):
+        if self._partial:
+            self._partial += bytes(self.frame_bytes - len(self._partial))
+            self._frames.append((self._partial_item, bytes(self._partial)))
+            self._partial.clear()
+
+    def _run(self):
+        playing = False
+        next_deadline = 0
+        while not self._stopped:
+            if not self._frames or (not playing and len(self._frames) < self.prebuffer_frames
+                                    and not self._response_done):
+                # Idle or filling the jitter buffer; don't wait forever for a
+                # prebuffer that a short response may never reach
+                self._ready.clear()
+                self._ready.wait(timeout=None if not self._frames else self.frame_s * self.prebuffer_frames)
+                if self._frames and not playing and not self._ready.is_set():
+                    playing = True
+                    next_deadline = time.monotonic()
+                continue
+
+            if not playing:
+                playing = True
+                next_deadline = time.monotonic()
+
+            item, frame = self._frames.popleft()
+            try:
+                self.send(frame)
+            except Exception as e:
+                logger.info(f"Downlink pacer stopped: {e}")
+                break
+            self.stats['frames'] += 1
+            self._played_ms[item[0]] = self._played_ms.get(item[0], 0) + self.frame_ms
+
+            next_deadline += self.frame_s
+            delay = next_deadline - time.monotonic()
+            if delay > 0:
+                gevent.sleep(delay)
+            elif delay < -self.frame_s:
+                # Fell behind (e.g. a blocked event loop); resync the clock
+                self.stats['late_frames'] += 1
+                next_deadline = time.monotonic()
+
+            if not self._frames:
+                playing = False
+                if not self._response_done:
+                    self.stats['underruns'] += 1
+
+    def summary(self):
+        return (f"downlink frames={self.stats['frames']} underruns={self.stats['underruns']} "
+                f"late_frames={self.stats['late_frames']} max_queue_depth={self.stats['max_queue_depth']} "
+                f"interruptions={self.stats['interruptions']} dropped_frames={self.stats['dropped_frames']}")
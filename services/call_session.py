@@ -0,0 +1,340 @@
+import base64
+import json
+import logging
+import time
+from collections import deque
+
+import gevent
+from gevent.event import AsyncResult, Event
+from gevent.queue import Full, Queue
+from websocket import ABNF
+
+from services import metrics
+from services.audio import UplinkAggregator, DownlinkPacer
+from services.codecs import Transcoder
+from services.vad import SilenceGate
+
+logger = logging.getLogger(__name__)
+
+RESPONSE_CANCEL = json.dumps({"type": "response.cancel"})
+RESPONSE_CREATE = json.dumps({"type": "response.create"})
+
+VONAGE = 'vonage'
+OPENAI = 'openai'
+TOOL = 'tool'
+
+# Inbound messages waiting for the call loop before the socket pumps block
+INBOX_SIZE = 64
+
+
+class SendQueue:
+    """
+    Outbound messages for one socket, written by a dedicated greenlet so a
+    slow peer never blocks the call loop.
+
+    Audio is droppable: once max_audio messages are waiting, new audio is
+    dropped (and counted) instead of queueing without bound. Control
+    messages are always queued and keep their order relative to audio.
+    """
+
+    def __init__(self, send, max_audio=25):
+        self.send = send
+        self.max_audio = max_audio
+        self._messages = deque()
+        self._audio = 0
+        self._ready = Event()
+        self._stopped = False
+        self.stats = {'messages': 0, 'dropped': 0, 'max_depth': 0}
+
+    @property
+    def depth(self):
+        return len(self._messages)
+
+    def start(self, on_error):
+        return gevent.spawn(self._run, on_error)
+
+    def stop(self):
+        self._stopped = True
+        self._ready.set()
+
+    def put(self, message, opcode=ABNF.OPCODE_TEXT):
+        self._messages.append((message, opcode, False))
+        self._wake()
+
+    def put_audio(self, message, opcode=ABNF.OPCODE_TEXT):
+        if self._audio >= self.max_audio:
+            self.stats['dropped'] += 1
+            return
+        self._audio += 1
+        self._messages.append((message, opcode, True))
+        self._wake()
+
+    def _wake(self):
+        self.stats['max_depth'] = max(self.stats['max_depth'], len(self._messages))
+        self._ready.set()
+
+    def _run(self, on_error):
+        while not self._stopped:
+            if not self._messages:
+                self._ready.clear()
+                self._ready.wait()
+                continue
+
+            message, opcode, audio = self._messages.popleft()
+            if audio:
+                self._audio -= 1
+            try:
+                self.send(message, opcode)
+            except Exception as e:
+                on_error(e)
+                return
+            self.stats['messages'] += 1
+
+
+class CallSession:
+    """
+    Bridges one Vonage call WebSocket and one OpenAI realtime WebSocket.
+
+    All call state (transcoder, uplink batching, VAD gate, downlink pacing,
+    barge-in, tool calls) is owned by run(), which handles one inbound
+    message at a time from either side, so nothing is shared between
+    threads. Both socket libraries only offer blocking receives, so each
+    socket has a pump greenlet that just receives into the loop's bounded
+    inbox; when the loop falls behind the pumps stop reading and TCP pushes
+    back on the sender.
+
+    Nothing in the loop blocks on a peer: messages to OpenAI go through a
+    SendQueue and audio to Vonage through the DownlinkPacer. Whichever side
+    closes or fails first ends the loop, and close() then tears down both
+    sockets and every greenlet of the call exactly once.
+
+    tools maps a function name to a callable taking the parsed arguments and
+    returning the output sent back to the model, or an AsyncResult for it.
+    Pending results are awaited off the loop, so audio keeps flowing both
+    ways while e.g. an order commits.
+    """
+
+    def __init__(self, vonage_ws, openai_ws, profile, config, tools=None, on_first_audio=None,
+                 started_at=None):
+        self.vonage_ws = vonage_ws
+        self.openai_ws = openai_ws
+        self.profile = profile
+        self.tools = tools or {}
+        self.on_first_audio = on_first_audio
+        self.started_at = started_at or time.monotonic()
+        self.first_audio_at = None
+        # Set at speech_stopped, cleared by the first audio delta of the reply
+        self.turn_started_at = None
+        self.end_reason = None
+        self._inbox = Queue(maxsize=INBOX_SIZE)
+        self._pumps = []
+        self._tool_waiters = []
+        self._sender = None
+        self._closed = False
+
+        flush_ms = config['UPLINK_FLUSH_MS']
+        # Converts between the Vonage and OpenAI audio formats of the profile
+        self.transcoder = Transcoder(profile)
+        self.to_openai = SendQueue(openai_ws.send,
+                                   max_audio=max(1, config['UPLINK_MAX_QUEUED_MS'] // flush_ms))
+        # Batches Vonage frames into fewer, larger appends to OpenAI
+        self.uplink = UplinkAggregator(self.to_openai.put_audio, flush_ms=flush_ms,
+                                       bytes_per_ms=profile.openai_bytes_per_ms)
+        # Optional local VAD: hold back long silences instead of streaming them
+        self.gate = None
+        if config['VAD_ENABLED']:
+            self.gate = SilenceGate(profile.vonage_bytes_per_ms,
+                                    threshold_rms=config['VAD_THRESHOLD_RMS'],
+                                    hangover_ms=config['VAD_HANGOVER_MS'],
+                                    preroll_ms=config['VAD_PREROLL_MS'],
+                                    keepalive_ms=config['VAD_KEEPALIVE_MS'])
+        # Sends assistant audio to Vonage as fixed 20ms frames in real time
+        self.downlink = DownlinkPacer(vonage_ws.send, bytes_per_ms=profile.vonage_bytes_per_ms,
+                                      prebuffer_frames=config['DOWNLINK_PREBUFFER_FRAMES'])
+
+    def run(self):
+        """Bridge the call until either side closes. Both sockets are closed on return."""
+        metrics.ACTIVE_CALLS.inc()
+        self.downlink.start()
+        self._sender = self.to_openai.start(lambda e: self._end(OPENAI, e))
+        self._pumps = [
+            gevent.spawn(self._pump, VONAGE, self.vonage_ws.receive),
+            gevent.spawn(self._pump, OPENAI, self.openai_ws.recv),
+        ]
+        try:
+            while True:
+                source, message = self._inbox.get()
+                if message is None:
+                    break
+                if source == VONAGE:
+                    self._on_vonage(message)
+                elif source == OPENAI:
+                    self._on_openai(message)
+                else:
+                    self._send_tool_output(*message)
+        finally:
+            self.close()
+
+    def close(self):
+        if self._closed:
+            return
+        self._closed = True
+        self.downlink.stop()
+        self.to_openai.stop()
+        for ws in (self.openai_ws, self.vonage_ws):
+            try:
+                ws.close()
+            except Exception:
+                pass
+        gevent.killall(self._pumps + self._tool_waiters + ([self._sender] if self._sender else []), timeout=1)
+        if self._pumps:
+            metrics.ACTIVE_CALLS.dec()
+            self._record_metrics()
+
+    def _record_metrics(self):
+        transcoder = self.transcoder.stats
+        for direction in ('vonage_in', 'openai_out', 'openai_in', 'vonage_out'):
+            metrics.CALL_AUDIO_BYTES.labels(direction=direction).observe(transcoder[direction])
+        metrics.CALL_AUDIO_FRAMES.labels(direction='vonage_in').observe(self.uplink.stats['frames'])
+        metrics.CALL_AUDIO_FRAMES.labels(direction='openai_out').observe(self.uplink.stats['messages'])
+        metrics.CALL_AUDIO_FRAMES.labels(direction='vonage_out').observe(self.downlink.stats['frames'])
+        metrics.DROPPED_FRAMES.labels(reason='uplink_backpressure').inc(self.to_openai.stats['dropped'])
+        metrics.DROPPED_FRAMES.labels(reason='barge_in').inc(self.downlink.stats['dropped_frames'])
+        metrics.CALLS.labels(ended_by=self.end_reason[0] if self.end_reason else 'error').inc()
+
+    def _pump(self, source, receive):
+        try:
+            while True:
+                message = receive()
+                if not message:
+                    break
+                self._inbox.put((source, message))
+        except Exception as e:
+            self._end(source, e)
+        else:
+            self._end(source, 'closed')
+
+    def _end(self, source, reason):
+        if self.end_reason is None:
+            self.end_reason = (source, reason)
+        if self._closed:
+            # The loop has exited and nobody drains the inbox any more
+            try:
+                self._inbox.put_nowait((source, None))
+            except Full:
+                pass
+            return
+        self._inbox.put((source, None))
+
+    def _on_vonage(self, data):
+        if not isinstance(data, bytes):
+            logger.debug(f"Received non-byte data from Vonage: {data}")
+            return
+
+        if self.gate is None:
+            self.uplink.add(self.transcoder.uplink(data))
+            return
+
+        frames, closed = self.gate.process(data)
+        for frame in frames:
+            self.uplink.add(self.transcoder.uplink(frame))
+        if closed:
+            self.uplink.flush()
+
+    def _on_openai(self, message):
+        event = json.loads(message)
+        event_type = event.get('type')
+
+        if event_type == 'response.audio.delta':
+            audio_b64 = event.get('delta')
+            if audio_b64:
+                if self.first_audio_at is None:
+                    self.first_audio_at = time.monotonic()
+                    if self.on_first_audio:
+                        self.on_first_audio((self.first_audio_at - self.started_at) * 1000)
+                if self.turn_started_at is not None:
+                    metrics.TURN_LATENCY_SECONDS.observe(time.monotonic() - self.turn_started_at)
+                    self.turn_started_at = None
+                # Queued and sent as paced 20ms frames
+                self.downlink.push(self.transcoder.downlink(base64.b64decode(audio_b64)),
+                                   event.get('item_id'), event.get('content_index', 0))
+
+        elif event_type == 'response.audio.done':
+            self.downlink.end_of_response()
+
+        elif event_type == 'input_audio_buffer.speech_stopped':
+            # End of speech: push out the buffered tail right away
+            self.uplink.flush()
+            self.turn_started_at = time.monotonic()
+
+        elif event_type == 'input_audio_buffer.speech_started':
+            self._on_barge_in()
+
+        elif event_type == 'response.function_call_arguments.done':
+            self._on_function_call(event)
+
+    def _on_barge_in(self):
+        # Stop local playback, cancel the response and truncate the assistant
+        # item to what the caller actually heard
+        cut = self.downlink.interrupt()
+        logger.info(f"User interruption detected - Cancelling OpenAI response (cut={cut})")
+        self.to_openai.put(RESPONSE_CANCEL)
+        if cut:
+            item_id, content_index, played_ms = cut
+            self.to_openai.put(json.dumps({
+                "type": "conversation.item.truncate",
+                "item_id": item_id,
+                "content_index": content_index,
+                "audio_end_ms": played_ms
+            }))
+
+    def _on_function_call(self, event):
+        name = event.get('name')
+        handler = self.tools.get(name)
+        if handler is None:
+            logger.warning(f"Ignoring call to unknown tool {name}")
+            return
+
+        started = time.monotonic()
+        try:
+            output = handler(json.loads(event.get('arguments') or '{}'))
+        except Exception as e:
+            logger.error(f"Tool {name} failed: {e}")
+            metrics.CALL_ERRORS.labels(stage='tool').inc()
+            return
+
+        if isinstance(output, AsyncResult):
+            self._tool_waiters.append(gevent.spawn(self._await_tool, name, event, output, started))
+        else:
+            self._send_tool_output(name, event, output, started)
+
+    def _await_tool(self, name, event, pending, started):
+        try:
+            output = pending.get()
+        except Exception as e:
+            logger.error(f"Tool {name} failed: {e}")
+            metrics.CALL_ERRORS.labels(stage='tool').inc()
+            return
+        # Hand the result back to the loop, which owns the OpenAI send queue
+        self._inbox.put((TOOL, (name, event, output, started)))
+
+    def _send_tool_output(self, name, event, output, started):
+        metrics.TOOL_SECONDS.labels(tool=name).observe(time.monotonic() - started)
+        self.to_openai.put(json.dumps({
+            "type": "conversation.item.create",
+            "item": {
+                "type": "function_call_output",
+                "call_id": event.get('call_id'),
+                "output": json.dumps(output)
+            }
+        }))
+        self.to_openai.put(RESPONSE_CREATE)
+
+    def summary(self):
+        source, reason = self.end_reason or (None, None)
+        return (f"ended_by={source} reason={reason} "
+                f"{self.uplink.summary()} {self.downlink.summary()} "
+                f"{self.transcoder.summary(time.monotonic() - self.started_at)} "
+                f"{self.gate.summary() if self.gate else 'vad=off'} "
+                f"openai_send_queue max_depth={self.to_openai.stats['max_depth']} "
+                f"dropped={self.to_openai.stats['dropped']}")
@@ -0,0 +1,204 @@
+import time
+
+import numpy as np
+
+# OpenAI realtime audio formats: sample rate and bytes per sample
+OPENAI_FORMATS = {
+    'pcm16': (24000, 2),
+    'g711_ulaw': (8000, 1),
+}
+
+
+class AudioProfile:
+    """How audio is carried on each leg of the bridge."""
+
+    def __init__(self, name, vonage_rate, openai_format):
+        self.name = name
+        self.vonage_rate = vonage_rate
+        self.openai_format = openai_format
+        self.openai_rate, self.openai_sample_bytes = OPENAI_FORMATS[openai_format]
+
+    @property
+    def content_type(self):
+        # Vonage WebSocket content-type for the NCCO connect action
+        return f"audio/l16;rate={self.vonage_rate}"
+
+    @property
+    def vonage_bytes_per_ms(self):
+        return self.vonage_rate * 2 // 1000
+
+    @property
+    def openai_bytes_per_ms(self):
+        return self.openai_rate * self.openai_sample_bytes // 1000
+
+    @property
+    def passthrough(self):
+        return self.openai_format == 'pcm16' and self.vonage_rate == self.openai_rate
+
+
+AUDIO_PROFILES = {
+    # Vonage L16 24kHz straight through to OpenAI pcm16 (no transcoding)
+    'l16_24k': AudioProfile('l16_24k', 24000, 'pcm16'),
+    # A third less Vonage bandwidth, resampled to/from 24kHz for OpenAI
+    'l16_16k': AudioProfile('l16_16k', 16000, 'pcm16'),
+    # Telephony quality: 8kHz from Vonage, G.711 u-law to OpenAI (1/6 of the bytes)
+    'ulaw_8k': AudioProfile('ulaw_8k', 8000, 'g711_ulaw'),
+}
+DEFAULT_AUDIO_PROFILE = 'l16_24k'
+
+
+def get_profile(name):
+    return AUDIO_PROFILES.get(name) or AUDIO_PROFILES[DEFAULT_AUDIO_PROFILE]
+
+
+def _ulaw_tables():
+    # G.711 u-law, computed for every int16 value so encoding is a single lookup
+    pcm = np.arange(-32768, 32768, dtype=np.int32)
+    sign = np.where(pcm < 0, 0x80, 0)
+    magnitude = np.minimum(np.abs(pcm), 32635) + 0x84
+    exponent = np.frexp(magnitude >> 7)[1] - 1
+    exponent = np.clip(exponent, 0, 7)
+    mantissa = (magnitude >> (exponent + 3)) & 0x0F
+    encoded = (~(sign | (exponent << 4) | mantissa)) & 0xFF
+
+    encode = np.empty(65536, dtype=np.uint8)
+    encode[pcm.astype(np.int16).view(np.uint16)] = encoded
+
+    codes = ~np.arange(256, dtype=np.int32) & 0xFF
+    exp = (codes >> 4) & 0x07
+    sample = (((codes & 0x0F) << 3) + 0x84) << exp
+    sample -= 0x84
+    decode = np.where(codes & 0x80, -sample, sample).astype(np.int16)
+    return encode, decode
+
+
+ULAW_ENCODE, ULAW_DECODE = _ulaw_tables()
+
+
+class _Buffer:
+    """Grow-only scratch array so steady-state frames don't allocate."""
+
+    def __init__(self, dtype, fill=None):
+        self.dtype = dtype
+        self.fill = fill
+        self.array = np.empty(0, dtype=dtype)
+
+    def get(self, size):
+        if self.array.size < size:
+            size_alloc = max(size, 2 * self.array.size)
+            self.array = self.fill(size_alloc) if self.fill else np.empty(size_alloc, dtype=self.dtype)
+        return self.array[:size]
+
+
+class LinearResampler:
+    """
+    Streaming linear-interpolation resampler for int16 mono PCM.
+
+    The last input sample and the fractional read position are carried
+    between chunks, so arbitrary chunk sizes resample without clicks.
+    """
+
+    def __init__(self, src_rate, dst_rate):
+        self.step = src_rate / dst_rate
+        self._prev = 0.0
+        self._pos = 1.0
+        self._work = _Buffer(np.float32)
+        self._positions = _Buffer(np.float64)
+        self._ramp = _Buffer(np.float64, fill=lambda size: np.arange(size, dtype=np.float64))
+        self._out = _Buffer(np.int16)
+
+    def process(self, samples):
+        n = samples.size
+        if n == 0:
+            return samples
+
+        # x[0] is the last sample of the previous chunk, x[1:] the new ones
+        x = self._work.get(n + 1)
+        x[0] = self._prev
+        x[1:] = samples
+
+        count = int((n - self._pos) // self.step) + 1 if self._pos <= n else 0
+        positions = self._positions.get(count)
+        np.multiply(self._ramp.get(count), self.step, out=positions)
+        positions += self._pos
+
+        out = self._out.get(count)
+        np.rint(np.interp(positions, self._ramp.get(n + 1), x), out=out, casting='unsafe')
+
+        self._prev = x[n]
+        self._pos = (positions[-1] + self.step - n) if count else (self._pos - n)
+        return out
+
+
+class Transcoder:
+    """
+    Converts audio between the Vonage leg and the OpenAI leg for a profile.
+    Keeps per-direction byte counts and processing time for reporting.
+    """
+
+    def __init__(self, profile):
+        self.profile = profile
+        self._up_resampler = None
+        self._down_resampler = None
+        if profile.vonage_rate != profile.openai_rate:
+            self._up_resampler = LinearResampler(profile.vonage_rate, profile.openai_rate)
+            self._down_resampler = LinearResampler(profile.openai_rate, profile.vonage_rate)
+        self._ulaw_out = _Buffer(np.uint8)
+        self._pcm_out = _Buffer(np.int16)
+        self.stats = {
+            'vonage_in': 0,
+            'openai_out': 0,
+            'openai_in': 0,
+            'vonage_out': 0,
+            'processing_s': 0.0,
+        }
+
+    def uplink(self, frame):
+        """Vonage L16 frame -> bytes in the OpenAI input format."""
+        self.stats['vonage_in'] += len(frame)
+        if self.profile.passthrough:
+            self.stats['openai_out'] += len(frame)
+            return frame
+
+        started = time.perf_counter()
+        samples = np.frombuffer(frame, dtype='<i2')
+        if self._up_resampler:
+            samples = self._up_resampler.process(samples)
+        if self.profile.openai_format == 'g711_ulaw':
+            out = self._ulaw_out.get(samples.size)
+            np.take(ULAW_ENCODE, samples.view(np.uint16), out=out)
+            data = out.tobytes()
+        else:
+            data = samples.astype('<i2', copy=False).tobytes()
+        self.stats['processing_s'] += time.perf_counter() - started
+        self.stats['openai_out'] += len(data)
+        return data
+
+    def downlink(self, audio):
+        """OpenAI output audio -> Vonage L16 bytes."""
+        self.stats['openai_in'] += len(audio)
+        if self.profile.passthrough:
+            self.stats['vonage_out'] += len(audio)
+            return audio
+
+        started = time.perf_counter()
+        if self.profile.openai_format == 'g711_ulaw':
+            codes = np.frombuffer(audio, dtype=np.uint8)
+            samples = self._pcm_out.get(codes.size)
+            np.take(ULAW_DECODE, codes, out=samples)
+        else:
+            samples = np.frombuffer(audio, dtype='<i2')
+        if self._down_resampler:
+            samples = self._down_resampler.process(samples)
+        data = samples.astype('<i2', copy=False).tobytes()
+        self.stats['processing_s'] += time.perf_counter() - started
+        self.stats['vonage_out'] += len(data)
+        return data
+
+    def summary(self, duration_s):
+        duration_s = max(duration_s, 1e-6)
+        kbps = {key: value * 8 / 1000 / duration_s for key, value in self.stats.items() if key != 'processing_s'}
+        return (f"profile={self.profile.name} "
+                f"vonage_in_kbps={kbps['vonage_in']:.0f} openai_out_kbps={kbps['openai_out']:.0f} "
+                f"openai_in_kbps={kbps['openai_in']:.0f} vonage_out_kbps={kbps['vonage_out']:.0f} "
+                f"transcode_cpu_ms={self.stats['processing_s'] * 1000:.1f}")
@@ -0,0 +1,94 @@
+import logging
+import time
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from sqlalchemy.pool import QueuePool
+
+from services import metrics
+
+logger = logging.getLogger(__name__)
+
+
+class TimedQueuePool(QueuePool):
+    """QueuePool that records how long each checkout waited for a connection."""
+
+    def _do_get(self):
+        started = time.perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            metrics.DB_POOL_WAIT_SECONDS.observe(time.perf_counter() - started)
+
+
+class DatabaseMonitor:
+    """
+    Query and event-loop health for the DB layer.
+
+    Records every statement's duration and logs the ones slower than
+    slow_query_ms. For Postgres the engine uses TimedQueuePool so pool
+    checkout waits are measured. gevent's monitor thread reports any
+    greenlet that keeps the loop busy longer than loop_block_ms (e.g. a
+    query on a non-cooperative driver, or CPU-heavy work), with its stack.
+
+    init_app must run before db.init_app so the pool class is in place.
+    """
+
+    def __init__(self, app=None):
+        self.slow_query_s = 0.2
+        self.loop_block_s = 0.1
+        self.stats = {'queries': 0, 'slow_queries': 0, 'loop_blocked': 0}
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.slow_query_s = app.config.get('DB_SLOW_QUERY_MS', 200) / 1000
+        self.loop_block_s = app.config.get('LOOP_BLOCK_THRESHOLD_MS', 100) / 1000
+
+        uri = app.config.get('SQLALCHEMY_DATABASE_URI') or ''
+        if uri.startswith('postgresql'):
+            options = dict(app.config.get('SQLALCHEMY_ENGINE_OPTIONS') or {})
+            options.setdefault('poolclass', TimedQueuePool)
+            app.config['SQLALCHEMY_ENGINE_OPTIONS'] = options
+
+        if not event.contains(Engine, 'before_cursor_execute', self._before_execute):
+            event.listen(Engine, 'before_cursor_execute', self._before_execute)
+            event.listen(Engine, 'after_cursor_execute', self._after_execute)
+
+        if self.loop_block_s > 0:
+            self._monitor_loop()
+        app.extensions['db_monitor'] = self
+
+    @staticmethod
+    def _before_execute(conn, cursor, statement, parameters, context, executemany):
+        conn.info['query_started'] = time.perf_counter()
+
+    def _after_execute(self, conn, cursor, statement, parameters, context, executemany):
+        elapsed = time.perf_counter() - conn.info.pop('query_started', time.perf_counter())
+        self.stats['queries'] += 1
+        metrics.DB_QUERY_SECONDS.observe(elapsed)
+        if elapsed >= self.slow_query_s:
+            self.stats['slow_queries'] += 1
+            metrics.DB_SLOW_QUERIES.inc()
+            logger.warning(f"Slow query ({elapsed * 1000:.0f}ms): {' '.join(statement.split())[:300]}")
+
+    def _monitor_loop(self):
+        import gevent
+        from gevent import events
+
+        gevent.config.max_blocking_time = self.loop_block_s
+        if self._on_gevent_event not in events.subscribers:
+            events.subscribers.append(self._on_gevent_event)
+        gevent.get_hub().start_periodic_monitoring_thread()
+
+    def _on_gevent_event(self, gevent_event):
+        from gevent.events import EventLoopBlocked
+
+        if not isinstance(gevent_event, EventLoopBlocked):
+            return
+        self.stats['loop_blocked'] += 1
+        metrics.LOOP_BLOCKED.inc()
+        # info holds the blocking greenlet's stack; the last lines show where it was
+        stack = ''.join(gevent_event.info[-6:]) if gevent_event.info else ''
+        logger.warning(f"Event loop blocked for over {gevent_event.blocking_time * 1000:.0f}ms by "
+                       f"{gevent_event.greenlet}:\n{stack}")
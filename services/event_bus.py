@@ -0,0 +1,240 @@
+import itertools
+import json
+import logging
+import time
+import uuid
+from collections import deque
+
+import gevent
+from gevent.event import Event
+from gevent.select import select
+
+from services.workers import ProcessGreenlets
+
+logger = logging.getLogger(__name__)
+
+
+class EventBus:
+    """
+    In-process SSE event bus.
+
+    Events are kept in a bounded ring buffer with monotonic ids, so a
+    reconnecting client only replays what it missed and memory stays flat.
+    Subscribers block on a gevent Event that is swapped out and set on every
+    publish, which wakes all waiting /events generators at once.
+    """
+
+    def __init__(self, app=None):
+        self.buffer_size = 500
+        self.keepalive_seconds = 15
+        # Ids are only meaningful within one process lifetime; the epoch lets
+        # us detect a Last-Event-ID coming from a previous process.
+        self.epoch = uuid.uuid4().hex[:8]
+        self._events = deque(maxlen=self.buffer_size)
+        self._last_id = 0
+        self._wakeup = Event()
+        self.backend = MemoryBackend(self)
+        self._handlers = {}
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.buffer_size = app.config.get('SSE_BUFFER_SIZE', self.buffer_size)
+        self.keepalive_seconds = app.config.get('SSE_KEEPALIVE_SECONDS', self.keepalive_seconds)
+        self._events = deque(self._events, maxlen=self.buffer_size)
+
+        backend = app.config.get('EVENT_BACKEND')
+        if backend == 'postgres':
+            self.backend = PostgresBackend(self, app)
+            # Make sure every worker is listening before it serves /events
+            app.before_request(self.backend.ensure_listener)
+        elif backend not in (None, 'memory'):
+            raise ValueError(f"Unknown EVENT_BACKEND: {backend}")
+        app.extensions['event_bus'] = self
+
+    @property
+    def last_id(self):
+        return self._last_id
+
+    def publish(self, event_type, data):
+        return self.backend.publish(event_type, data)
+
+    def on(self, event_type, handler):
+        """
+        Register an in-process handler for an internal event type (e.g. cache
+        invalidation). Internal events reach every worker through the backend
+        but are never streamed to SSE clients.
+        """
+        self._handlers.setdefault(event_type, []).append(handler)
+
+    def deliver(self, event_type, data):
+        """
+        Append an event to the local buffer and wake subscribers. Backends
+        call this once the event has reached this process.
+        """
+        if event_type in self._handlers:
+            for handler in self._handlers[event_type]:
+                try:
+                    handler(data)
+                except Exception as e:
+                    logger.error(f"Event handler for {event_type} failed: {e}")
+            return None
+
+        self._last_id += 1
+        event = {
+            'id': self._last_id,
+            'type': event_type,
+            'data': data,
+            'timestamp': time.time()
+        }
+        self._events.append(event)
+
+        # Wake every subscriber currently waiting, then arm a fresh Event
+        wakeup, self._wakeup = self._wakeup, Event()
+        wakeup.set()
+        return event
+
+    def format_id(self, event_id):
+        return f"{self.epoch}-{event_id}"
+
+    def parse_id(self, raw):
+        """
+        Parse a Last-Event-ID header. Returns the local event id, or None if
+        the id is missing, malformed or from another process.
+        """
+        if not raw:
+            return None
+        epoch, _, seq = raw.partition('-')
+        if epoch != self.epoch or not seq.isdigit():
+            return None
+        return int(seq)
+
+    def since(self, last_id):
+        """
+        Return (events, complete) for everything published after last_id.
+        complete is False when some of those events were already evicted.
+        """
+        if last_id >= self._last_id or not self._events:
+            return [], True
+
+        first_id = self._events[0]['id']
+        if last_id < first_id - 1:
+            return list(self._events), False
+
+        # Ids are contiguous inside the buffer so we can index directly
+        start = last_id - first_id + 1
+        return list(itertools.islice(self._events, start, None)), True
+
+    def wait(self, last_id, timeout):
+        """
+        Block the calling greenlet until something newer than last_id is
+        published or timeout expires.
+        """
+        if last_id < self._last_id:
+            return True
+        return self._wakeup.wait(timeout)
+
+
+class MemoryBackend:
+    """Single-process backend: events go straight into the local buffer."""
+
+    def __init__(self, bus):
+        self.bus = bus
+
+    def publish(self, event_type, data):
+        return self.bus.deliver(event_type, data)
+
+
+class PostgresBackend:
+    """
+    Cross-worker backend using Postgres LISTEN/NOTIFY.
+
+    publish() issues a NOTIFY through the regular SQLAlchemy engine. Each
+    process holds one dedicated psycopg2 connection that LISTENs on the
+    channel and feeds every notification (including its own) into the local
+    buffer, so all workers and machines see the same events.
+    """
+
+    # Postgres rejects NOTIFY payloads of 8000 bytes or more
+    MAX_PAYLOAD = 7900
+
+    def __init__(self, bus, app):
+        from sqlalchemy.engine import make_url
+
+        self.bus = bus
+        self.app = app
+        self.channel = app.config.get('EVENT_CHANNEL', 'order_events')
+        url = make_url(app.config['SQLALCHEMY_DATABASE_URI']).set(drivername='postgresql')
+        self.dsn = url.render_as_string(hide_password=False)
+        # One LISTEN connection per forked gunicorn worker
+        self._listener = ProcessGreenlets(self._listen_forever)
+
+    def publish(self, event_type, data):
+        from sqlalchemy import text
+        from extensions import db
+
+        self.ensure_listener()
+
+        payload = json.dumps({'type': event_type, 'data': data})
+        if len(payload.encode('utf-8')) > self.MAX_PAYLOAD:
+            # Too big for NOTIFY: send a marker so clients refetch instead
+            data = data or {}
+            marker = {'id': data.get('id'), 'user_id': data.get('user_id'), 'truncated': True}
+            payload = json.dumps({'type': event_type, 'data': marker})
+
+        with self.app.app_context():
+            with db.engine.connect() as conn:
+                conn.execute(text("SELECT pg_notify(:channel, :payload)"),
+                             {'channel': self.channel, 'payload': payload})
+                conn.commit()
+
+    def ensure_listener(self):
+        self._listener.ensure()
+
+    def _listen_forever(self):
+        import psycopg2
+        import psycopg2.extensions
+
+        backoff = 1
+        while True:
+            conn = None
+            try:
+                conn = psycopg2.connect(self.dsn)
+                conn.set_isolation_level(psycopg2.extensions.ISOLATION_LEVEL_AUTOCOMMIT)
+                with conn.cursor() as cur:
+                    cur.execute(f'LISTEN "{self.channel}"')
+                logger.info(f"Listening for events on Postgres channel '{self.channel}'")
+
+                if backoff > 1:
+                    # Anything published while we were disconnected is lost
+                    self.bus.deliver('resync', {})
+                backoff = 1
+
+                while True:
+                    readable, _, _ = select([conn], [], [], self.bus.keepalive_seconds)
+                    if not readable:
+                        # Idle: make sure the connection is still alive
+                        with conn.cursor() as cur:
+                            cur.execute("SELECT 1")
+                        continue
+
+                    conn.poll()
+                    while conn.notifies:
+                        notify = conn.notifies.pop(0)
+                        try:
+                            message = json.loads(notify.payload)
+                        except ValueError:
+                            logger.warning(f"Ignoring malformed event payload: {notify.payload[:100]}")
+                            continue
+                        self.bus.deliver(message.get('type'), message.get('data'))
+            except Exception as e:
+                logger.error(f"Event listener error: {e}. Reconnecting in {backoff}s")
+            finally:
+                if conn is not None:
+                    try:
+                        conn.close()
+                    except Exception:
+                        pass
+
+            gevent.sleep(backoff)
+            backoff = min(backoff * 2, 30)
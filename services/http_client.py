@@ -0,0 +1,175 @@
+import logging
+import random
+import time
+from email.utils import parsedate_to_datetime
+from urllib.parse import urlsplit
+
+import gevent
+import requests
+from requests.adapters import HTTPAdapter
+from requests.structures import CaseInsensitiveDict
+from urllib3.exceptions import NewConnectionError
+
+from services import metrics
+
+logger = logging.getLogger(__name__)
+
+RETRY_STATUSES = frozenset((429, 500, 502, 503, 504))
+# The server rejected the request without acting on it; safe to resend any method
+REJECTED_STATUSES = frozenset((429,))
+IDEMPOTENT_METHODS = frozenset(('GET', 'HEAD', 'OPTIONS', 'PUT', 'DELETE'))
+# Push services known to accept HTTP/2
+HTTP2_HOSTS = ('fcm.googleapis.com', 'updates.push.services.mozilla.com', 'web.push.apple.com')
+
+
+class ConnectFailed(requests.ConnectionError):
+    """The connection could not be opened, so nothing was sent."""
+
+
+def request_not_sent(error):
+    """True if a request failed before any of it reached the server."""
+    if isinstance(error, (requests.ConnectTimeout, ConnectFailed)):
+        return True
+    # requests wraps urllib3's MaxRetryError, whose reason is the original error
+    reason = getattr(error.args[0], 'reason', None) if error.args else None
+    return isinstance(reason, NewConnectionError)
+
+
+class HttpClient(requests.Session):
+    """
+    Shared outbound HTTP session for the whole worker.
+
+    urllib3 keeps one keep-alive pool per host, sized here for gevent (one
+    connection per concurrent greenlet up to pool_size), so repeat calls to
+    OpenAI or a push service reuse warm TLS connections. Every request gets
+    connect/read timeouts unless the caller passes its own, and is retried a
+    bounded number of times with jittered exponential backoff (honoring
+    Retry-After). Idempotent methods are retried on connection errors, read
+    timeouts and 429/5xx. Others (the POSTs to push services and OpenAI) are
+    only retried when the request never reached the server: a failed
+    connect, or a 429. Latency and errors are recorded per host.
+
+    With http2 enabled and httpx[http2] installed, requests to HTTP/2 push
+    services go over one multiplexed connection per host instead; callers
+    still get a requests.Response.
+    """
+
+    def __init__(self, app=None):
+        super().__init__()
+        self.timeout = (3.05, 30)
+        self.retries = 2
+        self.backoff = 0.5
+        self.max_backoff = 10
+        self._h2 = None
+        self._h2_hosts = frozenset()
+        self._mount(50)
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        config = app.config
+        self.timeout = (config.get('HTTP_CLIENT_CONNECT_TIMEOUT', 3.05), config.get('HTTP_CLIENT_READ_TIMEOUT', 30))
+        self.retries = config.get('HTTP_CLIENT_RETRIES', self.retries)
+        self.backoff = config.get('HTTP_CLIENT_BACKOFF', self.backoff)
+        self._mount(config.get('HTTP_CLIENT_POOL_SIZE', 50))
+        if config.get('HTTP_CLIENT_HTTP2'):
+            self._enable_http2(config.get('HTTP_CLIENT_POOL_SIZE', 50))
+        app.extensions['http_client'] = self
+
+    def _mount(self, pool_size):
+        adapter = HTTPAdapter(pool_connections=32, pool_maxsize=pool_size)
+        self.mount('https://', adapter)
+        self.mount('http://', adapter)
+
+    def _enable_http2(self, pool_size):
+        try:
+            import httpx
+            import h2  # noqa: F401 (httpx needs it for http2=True)
+        except ImportError:
+            logger.warning("HTTP_CLIENT_HTTP2 is set but httpx[http2] is not installed; using HTTP/1.1")
+            return
+        self._h2 = httpx.Client(http2=True, limits=httpx.Limits(max_connections=pool_size))
+        self._h2_hosts = frozenset(HTTP2_HOSTS)
+
+    def request(self, method, url, **kwargs):
+        if kwargs.get('timeout') is None:
+            kwargs['timeout'] = self.timeout
+        retries = kwargs.pop('retries', self.retries)
+        host = urlsplit(url).hostname or 'unknown'
+
+        idempotent = method.upper() in IDEMPOTENT_METHODS
+        attempt = 0
+        while True:
+            started = time.monotonic()
+            try:
+                response = self._send_once(method, url, host, **kwargs)
+            except (requests.ConnectionError, requests.Timeout) as e:
+                self._record_error(host, e)
+                if attempt >= retries or not (idempotent or request_not_sent(e)):
+                    raise
+                delay = self._backoff_delay(attempt)
+            else:
+                metrics.HTTP_CLIENT_SECONDS.labels(host=host, status=str(response.status_code)).observe(
+                    time.monotonic() - started)
+                if response.status_code not in RETRY_STATUSES or attempt >= retries:
+                    return response
+                metrics.HTTP_CLIENT_ERRORS.labels(host=host, kind=str(response.status_code)).inc()
+                if not idempotent and response.status_code not in REJECTED_STATUSES:
+                    return response
+                delay = self._retry_after(response) or self._backoff_delay(attempt)
+
+            attempt += 1
+            metrics.HTTP_CLIENT_RETRIES.labels(host=host).inc()
+            gevent.sleep(delay)
+
+    def _send_once(self, method, url, host, **kwargs):
+        if self._h2 is not None and host in self._h2_hosts:
+            return self._send_h2(method, url, **kwargs)
+        return super().request(method, url, **kwargs)
+
+    def _send_h2(self, method, url, data=None, json=None, headers=None, timeout=None, **kwargs):
+        import httpx
+
+        connect, read = timeout if isinstance(timeout, tuple) else (timeout, timeout)
+        try:
+            h2_response = self._h2.request(method, url, content=data, json=json, headers=headers,
+                                           timeout=httpx.Timeout(read, connect=connect))
+        except httpx.ConnectTimeout as e:
+            raise requests.ConnectTimeout(str(e))
+        except httpx.ConnectError as e:
+            raise ConnectFailed(str(e))
+        except httpx.TimeoutException as e:
+            raise requests.ReadTimeout(str(e))
+        except httpx.TransportError as e:
+            raise requests.ConnectionError(str(e))
+
+        response = requests.Response()
+        response.status_code = h2_response.status_code
+        response.reason = h2_response.reason_phrase
+        response.headers = CaseInsensitiveDict(h2_response.headers)
+        response.url = str(h2_response.url)
+        response.encoding = h2_response.encoding
+        response._content = h2_response.content
+        return response
+
+    def _backoff_delay(self, attempt):
+        # Full jitter keeps greenlets retrying the same host from synchronizing
+        return random.uniform(0, min(self.max_backoff, self.backoff * 2 ** attempt))
+
+    def _retry_after(self, response):
+        value = response.headers.get('Retry-After')
+        if not value:
+            return None
+        try:
+            seconds = float(value)
+        except ValueError:
+            try:
+                seconds = parsedate_to_datetime(value).timestamp() - time.time()
+            except (TypeError, ValueError):
+                return None
+        return min(max(seconds, 0), self.max_backoff)
+
+    @staticmethod
+    def _record_error(host, error):
+        kind = 'timeout' if isinstance(error, requests.Timeout) else 'connection'
+        metrics.HTTP_CLIENT_ERRORS.labels(host=host, kind=kind).inc()
@@ -0,0 +1,72 @@
+import time
+
+from flask_login import UserMixin
+
+# Everything a request needs to know about the logged-in user
+AUTH_COLUMNS = ('id', 'username', 'company', 'is_admin', 'agent_on')
+
+
+class SessionUser(UserMixin):
+    """Read-only snapshot of a user's auth columns, safe to share between requests."""
+
+    def __init__(self, row):
+        for name in AUTH_COLUMNS:
+            setattr(self, name, getattr(row, name))
+
+
+class IdentityCache:
+    """
+    Per-process cache behind Flask-Login's user_loader.
+
+    Requests that touch current_user (status clicks, /events connections)
+    get a SessionUser from memory instead of loading the full users row.
+    Misses load only AUTH_COLUMNS. Entries expire after ttl seconds, and
+    invalidate() drops a user in every worker through the event bus, so
+    changes made in admin apply on the next request.
+    """
+
+    def __init__(self, app=None):
+        self.ttl = 60
+        self._entries = {}
+        self.stats = {'hits': 0, 'loads': 0}
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        from extensions import event_bus
+
+        self.ttl = app.config.get('USER_CACHE_TTL', self.ttl)
+        event_bus.on('user_changed', lambda data: self.clear(data.get('user_id')))
+        app.extensions['identity_cache'] = self
+
+    def get(self, user_id):
+        """Return the SessionUser for user_id, or None. Needs an app context."""
+        entry = self._entries.get(user_id)
+        if entry is not None and time.monotonic() - entry[0] <= self.ttl:
+            self.stats['hits'] += 1
+            return entry[1]
+
+        from models import User
+
+        row = User.query.with_entities(*[getattr(User, name) for name in AUTH_COLUMNS]) \
+            .filter(User.id == user_id).first()
+        self.stats['loads'] += 1
+        if row is None:
+            self._entries.pop(user_id, None)
+            return None
+        user = SessionUser(row)
+        self._entries[user_id] = (time.monotonic(), user)
+        return user
+
+    def clear(self, user_id=None):
+        if user_id is None:
+            self._entries.clear()
+        else:
+            self._entries.pop(user_id, None)
+
+    def invalidate(self, user_id):
+        """Drop a user from every worker's cache after it changed or was deleted."""
+        from extensions import event_bus
+
+        self.clear(user_id)
+        event_bus.publish('user_changed', {'user_id': user_id})
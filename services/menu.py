@@ -0,0 +1,174 @@
+import difflib
+import re
+import unicodedata
+
+from flask import current_app
+
+# "Margherita: 9.50", "Reine - 11€", "Tajine poulet ...... 65 DH", "Coca $2"
+ITEM_RE = re.compile(
+    r'^(?P<name>.+?)\s*[:\-–—|.…]*\s*'
+    r'(?P<price>(?:[€$£]\s*)?\d+(?:[.,]\d{1,2})?\s*(?:€|eur(?:os?)?|dhs?|mad|\$|£)?)$',
+    re.IGNORECASE
+)
+BULLET_RE = re.compile(r'^[\s\-•*·–]+')
+OPTIONS_RE = re.compile(r'\((?P<options>[^)]*)\)')
+
+LOOKUP_LIMIT = 8
+
+
+def parse_menu(text):
+    """
+    Parse free-text menu (typed by an admin or extracted from a photo) into
+    item dicts with category, name, price and options, in menu order.
+
+    Lines ending in ':' or written in capitals (without a price) start a
+    category; every other line is an item, with a trailing price if there is
+    one. Text in parentheses, or after ' - ' in the name, becomes options.
+    """
+    items = []
+    category = None
+    for raw in (text or '').splitlines():
+        line = BULLET_RE.sub('', raw.strip().lstrip('#')).strip()
+        if not line:
+            continue
+
+        match = ITEM_RE.match(line)
+        if not match and (line.endswith(':') or (line.isupper() and len(line.split()) <= 5)):
+            category = line.rstrip(':').strip().title()
+            continue
+
+        name, price = (match.group('name'), match.group('price').strip()) if match else (line, None)
+        options = [found.group('options').strip() for found in OPTIONS_RE.finditer(name)]
+        name = OPTIONS_RE.sub('', name).strip()
+        if ' - ' in name:
+            name, description = name.split(' - ', 1)
+            options.insert(0, description.strip())
+
+        items.append({
+            'category': category,
+            'name': name.strip(' :-'),
+            'price': price,
+            'options': ', '.join(option for option in options if option) or None,
+        })
+    return items
+
+
+def replace_menu(user, text):
+    """Store a new menu text for user and rebuild its structured items. Caller commits."""
+    from extensions import db
+    from models import MenuItem
+
+    user.menu = text
+    user.menu_version = (user.menu_version or 0) + 1
+    MenuItem.query.filter_by(user_id=user.id).delete(synchronize_session=False)
+    db.session.add_all(
+        MenuItem(user_id=user.id, position=position, **item)
+        for position, item in enumerate(parse_menu(text))
+    )
+
+
+def fold(text):
+    # Lowercase without accents, so "creme brulee" finds "Crème brûlée"
+    text = unicodedata.normalize('NFKD', text or '')
+    return ''.join(c for c in text if not unicodedata.combining(c)).lower()
+
+
+def tokens(text):
+    return re.findall(r'\w+', fold(text))
+
+
+class CompiledMenu:
+    """A tenant's menu at one version: prompt text plus a lookup index."""
+
+    def __init__(self, version, items, inline_max_items):
+        self.version = version
+        self.items = items
+        # Long menus only list names in the prompt; details come from lookup_menu
+        self.needs_lookup = len(items) > inline_max_items
+        self.prompt = self._render(with_details=not self.needs_lookup)
+        self._index = [(item, set(tokens(' '.join(filter(None, (item['category'], item['name'], item['options']))))))
+                       for item in items]
+        self._names = {fold(item['name']): item for item in items}
+
+    def _render(self, with_details):
+        lines = []
+        for category, items in self._by_category():
+            entries = [self._entry(item) if with_details else item['name'] for item in items]
+            lines.append(f"[{category}] " + ' | '.join(entries) if category else ' | '.join(entries))
+        return '\n'.join(lines)
+
+    def _by_category(self):
+        groups = []
+        for item in self.items:
+            if not groups or groups[-1][0] != item['category']:
+                groups.append((item['category'], []))
+            groups[-1][1].append(item)
+        return groups
+
+    @staticmethod
+    def _entry(item):
+        entry = item['name']
+        if item['price']:
+            entry += f" {item['price']}"
+        if item['options']:
+            entry += f" ({item['options']})"
+        return entry
+
+    def lookup(self, query):
+        """Items matching query (item or category words, typos tolerated), best first."""
+        wanted = tokens(query)
+        if not wanted:
+            return []
+
+        scored = []
+        for item, item_tokens in self._index:
+            score = sum(1 for word in wanted if any(token.startswith(word) for token in item_tokens))
+            if score:
+                scored.append((score, item))
+        if scored:
+            best = max(score for score, _ in scored)
+            return [item for score, item in scored if score == best][:LOOKUP_LIMIT]
+
+        close = difflib.get_close_matches(fold(query), self._names.keys(), n=LOOKUP_LIMIT, cutoff=0.6)
+        return [self._names[name] for name in close]
+
+
+class MenuCatalog:
+    """
+    Per-tenant cache of compiled menus, keyed by the tenant's menu_version.
+
+    Menu rows are read and rendered once per version per worker; calls and
+    lookup_menu tool calls after that are served from memory.
+    """
+
+    def __init__(self):
+        self._entries = {}
+        self.stats = {'hits': 0, 'builds': 0, 'lookups': 0}
+
+    def get(self, tenant):
+        """Return the CompiledMenu for a tenant config dict, or None. Needs an app context."""
+        if not tenant or not tenant['menu_version']:
+            return None
+
+        entry = self._entries.get(tenant['id'])
+        if entry is not None and entry.version == tenant['menu_version']:
+            self.stats['hits'] += 1
+            return entry
+
+        from models import MenuItem
+
+        rows = MenuItem.query.filter_by(user_id=tenant['id']).order_by(MenuItem.position).all()
+        self.stats['builds'] += 1
+        entry = CompiledMenu(tenant['menu_version'], [row.to_dict() for row in rows],
+                             current_app.config['MENU_INLINE_MAX_ITEMS'])
+        self._entries[tenant['id']] = entry
+        return entry
+
+    def lookup(self, tenant, query):
+        self.stats['lookups'] += 1
+        menu = self.get(tenant)
+        items = menu.lookup(query) if menu else []
+        return {'query': query, 'items': items, 'found': bool(items)}
+
+
+menu_catalog = MenuCatalog()
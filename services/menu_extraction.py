@@ -0,0 +1,221 @@
+import base64
+import hashlib
+import io
+import logging
+import uuid
+from datetime import datetime, timedelta
+
+import gevent
+from gevent.pool import Pool
+
+logger = logging.getLogger(__name__)
+
+VISION_URL = "https://api.openai.com/v1/chat/completions"
+VISION_MODEL = "gpt-4o"
+EXTRACTION_PROMPT = "Extract strictly only the menu items and their prices from this image. output the result as a raw text list (Item: Price). Do NOT include any introductory text, markdown formatting (like ```), headers, footers, or any conversational filler. Just the data."
+
+# High-detail vision input is scaled to fit 2048x2048, then to 768px on the
+# short side; anything larger is uploaded only to be thrown away
+MAX_LONG_SIDE = 2048
+MAX_SHORT_SIDE = 768
+JPEG_QUALITY = 85
+
+
+def content_hash(image_bytes):
+    # The prompt and model are part of the key: changing either re-extracts
+    digest = hashlib.sha256(f"{VISION_MODEL}\n{EXTRACTION_PROMPT}\n".encode('utf-8'))
+    digest.update(image_bytes)
+    return digest.hexdigest()
+
+
+def downscale(image_bytes):
+    """Return the image as a JPEG no larger than the model's working resolution."""
+    from PIL import Image, ImageOps
+
+    image = ImageOps.exif_transpose(Image.open(io.BytesIO(image_bytes)))
+    image = image.convert('RGB')
+    width, height = image.size
+    scale = min(1.0, MAX_LONG_SIDE / max(width, height), MAX_SHORT_SIDE / min(width, height))
+    if scale < 1.0:
+        image = image.resize((max(1, round(width * scale)), max(1, round(height * scale))), Image.LANCZOS)
+
+    out = io.BytesIO()
+    image.save(out, format='JPEG', quality=JPEG_QUALITY, optimize=True)
+    return out.getvalue()
+
+
+class MenuExtractor:
+    """
+    Background menu extraction from uploaded photos.
+
+    submit() records a MenuJob and returns its id right away; the job runs
+    in a greenlet. Each page is looked up by content hash first, and only
+    new pages are downscaled (in gevent's thread pool, off the event loop)
+    and sent to the vision model. Pages of a job are extracted concurrently,
+    with vision calls across all jobs bounded by the pool size. The job's
+    page texts are joined in upload order and stored as the user's menu.
+    Job state lives in the DB so any worker can answer status polls. A job
+    runs for at most job_timeout seconds; one left pending or running past
+    that (its worker died) is failed when polled.
+    """
+
+    def __init__(self, app=None):
+        self.app = None
+        self.timeout = (5, 90)
+        self.job_timeout = 600
+        self._pool = None
+        self.stats = {'jobs': 0, 'pages': 0, 'cache_hits': 0, 'failed': 0}
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.app = app
+        self.timeout = (app.config.get('MENU_EXTRACTION_CONNECT_TIMEOUT', 5),
+                        app.config.get('MENU_EXTRACTION_READ_TIMEOUT', 90))
+        self.job_timeout = app.config.get('MENU_JOB_TIMEOUT', self.job_timeout)
+        self._pool = Pool(app.config.get('MENU_EXTRACTION_CONCURRENCY', 4))
+        app.extensions['menu_extractor'] = self
+
+    def submit(self, user_id, images):
+        """Start extracting a menu from a list of page images (bytes). Returns the job id."""
+        from extensions import db
+        from models import MenuJob
+
+        job = MenuJob(id=uuid.uuid4().hex, user_id=user_id, pages=len(images))
+        db.session.add(job)
+        db.session.commit()
+        self.stats['jobs'] += 1
+        gevent.spawn(self._run, job.id, user_id, images)
+        return job.id
+
+    def _run(self, job_id, user_id, images):
+        from extensions import db, tenant_router
+        from models import MenuJob, User
+        from services.menu import replace_menu
+
+        with self.app.app_context():
+            job = MenuJob.query.get(job_id)
+            job.status = 'running'
+            job.started_at = datetime.utcnow()
+            db.session.commit()
+
+            # Anything that escapes below (e.g. the greenlet being killed) still fails the job
+            error = 'Extraction was interrupted'
+            try:
+                with gevent.Timeout(self.job_timeout, RuntimeError('Menu extraction timed out')):
+                    hashes = [content_hash(image) for image in images]
+                    texts = self._cached(hashes)
+                    job.cached_pages = len(texts)
+                    self.stats['cache_hits'] += len(texts)
+
+                    missing = [(key, image) for key, image in zip(hashes, images) if key not in texts]
+                    # Pages run side by side; the shared pool caps vision calls across jobs
+                    greenlets = [self._pool.spawn(self._extract_page, image) for _, image in missing]
+                    try:
+                        gevent.joinall(greenlets, raise_error=True)
+                    finally:
+                        gevent.killall(greenlets, block=False)
+                    for (key, _), greenlet in zip(missing, greenlets):
+                        texts[key] = greenlet.value
+                        self._store(key, greenlet.value)
+
+                    menu_text = '\n'.join(texts[key].strip() for key in hashes)
+                    user = User.query.get(user_id)
+                    if user is None:
+                        raise RuntimeError('User not found')
+                    replace_menu(user, menu_text)
+                    job.menu_text = menu_text
+                    job.status = 'done'
+                    job.finished_at = datetime.utcnow()
+                    db.session.commit()
+                error = None
+            except Exception as e:
+                error = str(e)
+                logger.error(f"Menu extraction job {job_id} failed: {e}")
+            finally:
+                if error is not None:
+                    self._fail(job_id, error)
+
+            if error is None:
+                tenant_router.invalidate()
+
+    def _fail(self, job_id, error):
+        from extensions import db
+        from models import MenuJob
+
+        try:
+            db.session.rollback()
+            job = MenuJob.query.get(job_id)
+            job.status = 'failed'
+            job.error = error
+            job.finished_at = datetime.utcnow()
+            db.session.commit()
+            self.stats['failed'] += 1
+        except Exception as e:
+            # expire_if_stale() fails the job once it is past job_timeout
+            logger.error(f"Could not mark menu extraction job {job_id} failed: {e}")
+
+    def expire_if_stale(self, job):
+        """
+        Fail a pending/running job older than job_timeout, e.g. because the
+        worker running it died. Called when the job is polled.
+        """
+        from extensions import db
+
+        if job.status not in ('pending', 'running'):
+            return job
+        if datetime.utcnow() - (job.started_at or job.created_at) <= timedelta(seconds=self.job_timeout):
+            return job
+        job.status = 'failed'
+        job.error = 'Extraction did not finish (worker restarted?); please upload again'
+        job.finished_at = datetime.utcnow()
+        db.session.commit()
+        self.stats['failed'] += 1
+        return job
+
+    def _cached(self, hashes):
+        from models import MenuExtraction
+
+        rows = MenuExtraction.query.filter(MenuExtraction.content_hash.in_(set(hashes))).all()
+        return {row.content_hash: row.menu_text for row in rows}
+
+    def _store(self, key, menu_text):
+        from sqlalchemy.exc import IntegrityError
+        from extensions import db
+        from models import MenuExtraction
+
+        try:
+            with db.session.begin_nested():
+                db.session.add(MenuExtraction(content_hash=key, menu_text=menu_text))
+        except IntegrityError:
+            # Another job extracted the same page meanwhile
+            pass
+
+    def _extract_page(self, image_bytes):
+        self.stats['pages'] += 1
+        # Pillow work is CPU-bound; keep it off the loop serving live calls
+        jpeg = gevent.get_hub().threadpool.apply(downscale, (image_bytes,))
+        payload = {
+            "model": VISION_MODEL,
+            "messages": [
+                {
+                    "role": "user",
+                    "content": [
+                        {"type": "text", "text": EXTRACTION_PROMPT},
+                        {"type": "image_url", "image_url": {
+                            "url": f"data:image/jpeg;base64,{base64.b64encode(jpeg).decode('ascii')}",
+                            "detail": "high"
+                        }}
+                    ]
+                }
+            ],
+            "max_tokens": 1000
+        }
+        from extensions import http_client
+
+        # Pooled client: warm TLS to OpenAI, retries on 429/5xx
+        response = http_client.post(VISION_URL, json=payload, timeout=self.timeout, headers={
+            "Authorization": f"Bearer {self.app.config['OPENAI_API_KEY']}"
+        })
+        response.raise_for_status()
+        return response.json()['choices'][0]['message']['content']
@@ -0,0 +1,81 @@
+import os
+
+from prometheus_client import (CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry, Counter, Gauge, Histogram,
+                               generate_latest)
+
+# In multiprocess mode metrics are backed by files in this directory; scripts
+# (migrate_db.py, archive_orders.py) run without gunicorn's on_starting hook
+if os.environ.get('PROMETHEUS_MULTIPROC_DIR'):
+    os.makedirs(os.environ['PROMETHEUS_MULTIPROC_DIR'], exist_ok=True)
+
+# Sub-second buckets: the voice path is judged in hundreds of milliseconds
+LATENCY_BUCKETS = (0.05, 0.1, 0.2, 0.3, 0.5, 0.75, 1.0, 1.5, 2.0, 3.0, 5.0, 10.0)
+BYTES_BUCKETS = (1e4, 1e5, 5e5, 1e6, 2.5e6, 5e6, 1e7, 2.5e7, 5e7)
+FRAMES_BUCKETS = (10, 100, 500, 1000, 2500, 5000, 10000, 25000, 50000)
+
+CALL_SETUP_SECONDS = Histogram(
+    'voice_call_setup_seconds', 'Time from /webhooks/answer to the OpenAI session being ready',
+    ['warm'], buckets=LATENCY_BUCKETS)
+FIRST_AUDIO_SECONDS = Histogram(
+    'voice_first_audio_seconds', 'Time from /webhooks/answer to the first assistant audio',
+    ['warm'], buckets=LATENCY_BUCKETS)
+TURN_LATENCY_SECONDS = Histogram(
+    'voice_turn_latency_seconds', 'Time from speech_stopped to the first audio delta of the reply',
+    buckets=LATENCY_BUCKETS)
+TOOL_SECONDS = Histogram(
+    'voice_tool_seconds', 'Time from a function call to its result (DB commit for create_order_tool)',
+    ['tool'], buckets=LATENCY_BUCKETS)
+CALL_AUDIO_BYTES = Histogram(
+    'voice_call_audio_bytes', 'Audio bytes per call on each leg', ['direction'], buckets=BYTES_BUCKETS)
+CALL_AUDIO_FRAMES = Histogram(
+    'voice_call_audio_frames', 'WebSocket audio messages per call on each leg', ['direction'],
+    buckets=FRAMES_BUCKETS)
+DROPPED_FRAMES = Counter(
+    'voice_dropped_frames_total', 'Audio frames dropped by the bridge', ['reason'])
+CALLS = Counter(
+    'voice_calls_total', 'Finished calls by the side that ended them', ['ended_by'])
+CALL_ERRORS = Counter(
+    'voice_call_errors_total', 'Calls that failed to connect or ended on an error', ['stage'])
+PREWARM_CONNECTIONS = Counter(
+    'voice_prewarm_connections_total',
+    'Pre-warmed OpenAI connections by outcome (cross_worker: the stream reached another worker)', ['result'])
+ACTIVE_CALLS = Gauge(
+    'voice_active_calls', 'Calls currently bridged', multiprocess_mode='livesum')
+
+PUSH_QUEUE_DEPTH = Gauge(
+    'push_queue_depth', 'Notifications waiting for the push dispatcher', multiprocess_mode='livesum')
+SSE_STREAMS = Gauge(
+    'sse_open_streams', 'Open /events streams', multiprocess_mode='livesum')
+SSE_BACKLOG_EVENTS = Histogram(
+    'sse_backlog_events', 'Events pending for a stream each time it wakes up',
+    buckets=(1, 2, 5, 10, 25, 50, 100, 250, 500))
+
+HTTP_CLIENT_SECONDS = Histogram(
+    'http_client_request_seconds', 'Outbound HTTP request latency per attempt', ['host', 'status'],
+    buckets=LATENCY_BUCKETS + (30.0, 60.0))
+HTTP_CLIENT_ERRORS = Counter(
+    'http_client_errors_total', 'Outbound HTTP attempts that failed or got a retryable status', ['host', 'kind'])
+HTTP_CLIENT_RETRIES = Counter(
+    'http_client_retries_total', 'Outbound HTTP retries', ['host'])
+
+DB_POOL_WAIT_SECONDS = Histogram(
+    'db_pool_checkout_wait_seconds', 'Time spent waiting for a pooled DB connection',
+    buckets=(0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0))
+DB_QUERY_SECONDS = Histogram(
+    'db_query_seconds', 'DB statement execution time',
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0))
+DB_SLOW_QUERIES = Counter(
+    'db_slow_queries_total', 'DB statements slower than DB_SLOW_QUERY_MS')
+LOOP_BLOCKED = Counter(
+    'gevent_loop_blocked_total', 'Times a greenlet held the event loop longer than LOOP_BLOCK_THRESHOLD_MS')
+
+
+def render():
+    """Return (body, content_type) for the /metrics endpoint."""
+    registry = REGISTRY
+    if os.environ.get('PROMETHEUS_MULTIPROC_DIR'):
+        # Aggregate every gunicorn worker instead of whichever one got the scrape
+        from prometheus_client import multiprocess
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    return generate_latest(registry), CONTENT_TYPE_LATEST
@@ -0,0 +1,96 @@
+import logging
+
+from gevent.event import AsyncResult
+from gevent.queue import Queue, Full
+
+from services import outbox
+from services.workers import ProcessGreenlets
+
+logger = logging.getLogger(__name__)
+
+
+class OrderIngest:
+    """
+    Persists orders placed during calls without blocking the call.
+
+    submit() queues the order and returns an AsyncResult immediately.
+    Worker greenlets write the order and its outbox row in one transaction
+    and resolve the result with the acknowledgement for the model as soon as
+    the commit returns; the dashboard event and push notification are then
+    delivered from the outbox by OutboxRelay.
+    """
+
+    def __init__(self, app=None):
+        self.app = None
+        self.workers = 4
+        self.queue_size = 100
+        self._queue = None
+        self._workers = ProcessGreenlets(self._work, count=self.workers, on_fork=self._new_queue)
+        self.stats = {'submitted': 0, 'committed': 0, 'failed': 0, 'rejected': 0}
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.app = app
+        self.workers = app.config.get('ORDER_INGEST_WORKERS', self.workers)
+        self._workers.count = self.workers
+        self.queue_size = app.config.get('ORDER_INGEST_QUEUE_SIZE', self.queue_size)
+        app.extensions['order_ingest'] = self
+
+    @property
+    def queue_depth(self):
+        return self._queue.qsize() if self._queue is not None else 0
+
+    def submit(self, fields, push=None):
+        """
+        Queue an order (Order column values) and an optional push message.
+        The AsyncResult is set to {"status": "success", "order_id": ...} once
+        committed, or to the exception if the order could not be stored.
+        """
+        result = AsyncResult()
+        self._workers.ensure()
+        try:
+            self._queue.put_nowait((fields, push, result))
+            self.stats['submitted'] += 1
+        except Full:
+            self.stats['rejected'] += 1
+            result.set_exception(RuntimeError("Order ingest queue full"))
+        return result
+
+    def _new_queue(self):
+        self._queue = Queue(self.queue_size)
+
+    def _work(self):
+        from extensions import outbox_relay
+
+        while True:
+            fields, push, result = self._queue.get()
+            with self.app.app_context():
+                try:
+                    order_id = self._commit(fields, push)
+                except Exception as e:
+                    self.stats['failed'] += 1
+                    logger.error(f"Order ingest failed: {e}")
+                    result.set_exception(e)
+                    continue
+
+            self.stats['committed'] += 1
+            result.set({"status": "success", "order_id": order_id})
+            outbox_relay.wake()
+
+    def _commit(self, fields, push):
+        from extensions import db
+        from models import Order
+
+        order = Order(status='recu', **fields)
+        db.session.add(order)
+        try:
+            # Flush assigns the id and timestamps the outbox payload needs
+            db.session.flush()
+            outbox.record('new_order', order.to_dict(), push=push, coalesce_key='new_order',
+                          user_id=order.user_id)
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
+        return order.id
@@ -0,0 +1,105 @@
+import json
+import logging
+
+from gevent.event import Event
+
+from services.workers import ProcessGreenlets
+
+logger = logging.getLogger(__name__)
+
+
+def record(event_type, data, push=None, coalesce_key=None, user_id=None):
+    """
+    Add an outbox row to the current DB session. It commits (or rolls back)
+    together with the caller's transaction; call outbox_relay.wake() after
+    the commit. user_id scopes the push to that restaurant's subscriptions.
+    """
+    from extensions import db
+    from models import OutboxEvent
+
+    db.session.add(OutboxEvent(
+        event_type=event_type,
+        payload=json.dumps(data),
+        push=json.dumps(push) if push else None,
+        coalesce_key=coalesce_key,
+        user_id=user_id
+    ))
+
+
+class OutboxRelay:
+    """
+    Delivers committed outbox rows: publishes each event on the event bus,
+    queues its push notification, then deletes the rows.
+
+    Writers call wake() after committing so delivery starts right away; the
+    relay also polls every poll_seconds to pick up rows left behind by a
+    crashed worker. On Postgres rows are claimed with FOR UPDATE SKIP LOCKED
+    so workers never deliver the same row twice. Delivery is at-least-once:
+    rows are only deleted after their side effects were handed off.
+    """
+
+    def __init__(self, app=None):
+        self.app = None
+        self.poll_seconds = 5
+        self.batch_size = 100
+        self._wakeup = Event()
+        self._worker = ProcessGreenlets(self._run)
+        self.stats = {'delivered': 0, 'batches': 0, 'errors': 0}
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.app = app
+        self.poll_seconds = app.config.get('OUTBOX_POLL_SECONDS', self.poll_seconds)
+        self.batch_size = app.config.get('OUTBOX_BATCH_SIZE', self.batch_size)
+        app.before_request(self.ensure_worker)
+        app.extensions['outbox_relay'] = self
+
+    def wake(self):
+        self.ensure_worker()
+        self._wakeup.set()
+
+    def ensure_worker(self):
+        self._worker.ensure()
+
+    def _run(self):
+        while True:
+            self._wakeup.wait(timeout=self.poll_seconds)
+            self._wakeup.clear()
+            try:
+                with self.app.app_context():
+                    while self.deliver_batch() == self.batch_size:
+                        pass
+            except Exception as e:
+                self.stats['errors'] += 1
+                logger.error(f"Outbox delivery error: {e}")
+
+    def deliver_batch(self):
+        """Deliver up to batch_size pending rows. Needs an app context. Returns the number delivered."""
+        from extensions import db, event_bus, push_dispatcher
+        from models import OutboxEvent
+
+        rows = (OutboxEvent.query.order_by(OutboxEvent.id)
+                .limit(self.batch_size).with_for_update(skip_locked=True).all())
+        if not rows:
+            db.session.rollback()
+            return 0
+
+        try:
+            for row in rows:
+                event_bus.publish(row.event_type, json.loads(row.payload))
+                if row.push and row.user_id is None:
+                    # Without an owner it would go to every restaurant's subscriptions
+                    logger.warning(f"Dropping push for outbox event {row.id} ({row.event_type}): no user_id")
+                elif row.push:
+                    push_dispatcher.enqueue(json.loads(row.push), coalesce_key=row.coalesce_key,
+                                            user_id=row.user_id)
+            OutboxEvent.query.filter(OutboxEvent.id.in_([row.id for row in rows])).delete(synchronize_session=False)
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
+
+        self.stats['delivered'] += len(rows)
+        self.stats['batches'] += 1
+        return len(rows)
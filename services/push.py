@@ -0,0 +1,201 @@
+import json
+import logging
+import time
+
+from gevent.pool import Pool
+from gevent.queue import Queue, Full, Empty
+from pywebpush import WebPusher, WebPushException
+
+from services import metrics
+from services.vapid import VapidHeaderCache
+from services.workers import ProcessGreenlets
+
+logger = logging.getLogger(__name__)
+
+
+class PushDispatcher:
+    """
+    Background Web Push sender.
+
+    enqueue() only drops the message on a bounded queue, so callers on the
+    voice path never wait on push services. A drain greenlet picks messages
+    up and fans each one out to every subscription through a bounded greenlet
+    pool. Subscriptions reported as gone (404/410) are removed in a single
+    DELETE per message.
+
+    Messages enqueued with a user_id only go to that restaurant's
+    subscriptions. Messages with a coalesce_key (e.g. new orders) are held
+    for a short quiet window; everything with the same key and user_id that
+    arrives within it is merged into one summary push, up to a maximum delay.
+    Each (user_id, coalesce_key) has its own window, so restaurants whose
+    orders interleave are still coalesced separately.
+    """
+
+    def __init__(self, app=None):
+        self.app = None
+        self.pool_size = 10
+        self.queue_size = 100
+        self.coalesce_window = 2.0
+        self.coalesce_max_delay = 5.0
+        self._queue = None
+        self._worker = ProcessGreenlets(self._drain, on_fork=self._new_queue)
+        self.vapid_cache = None
+        self.stats = {
+            'enqueued': 0,
+            'dropped': 0,
+            'sent': 0,
+            'failed': 0,
+            'expired': 0,
+            'coalesced': 0,
+        }
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.app = app
+        self.pool_size = app.config.get('PUSH_POOL_SIZE', self.pool_size)
+        self.queue_size = app.config.get('PUSH_QUEUE_SIZE', self.queue_size)
+        self.coalesce_window = app.config.get('PUSH_COALESCE_WINDOW', self.coalesce_window)
+        self.coalesce_max_delay = app.config.get('PUSH_COALESCE_MAX_DELAY', self.coalesce_max_delay)
+        app.extensions['push_dispatcher'] = self
+
+    @property
+    def queue_depth(self):
+        return self._queue.qsize() if self._queue is not None else 0
+
+    def enqueue(self, message_body, coalesce_key=None, user_id=None):
+        self._worker.ensure()
+        try:
+            self._queue.put_nowait(((user_id, coalesce_key), message_body))
+            self.stats['enqueued'] += 1
+            metrics.PUSH_QUEUE_DEPTH.set(self._queue.qsize())
+        except Full:
+            self.stats['dropped'] += 1
+            logger.warning(f"Push queue full, dropping notification: {message_body}")
+
+    def _new_queue(self):
+        self._queue = Queue(self.queue_size)
+
+    def _drain(self):
+        # Coalescing buckets: (user_id, coalesce_key) -> [messages, flush_at, deadline]
+        buckets = {}
+        while True:
+            now = time.monotonic()
+            for key in [key for key, bucket in buckets.items() if bucket[1] <= now]:
+                self._send(key[0], buckets.pop(key)[0])
+
+            # Sleep until the next message or the next bucket is due
+            timeout = None
+            if buckets:
+                timeout = max(0, min(bucket[1] for bucket in buckets.values()) - time.monotonic())
+            try:
+                key, message_body = self._queue.get(timeout=timeout)
+            except Empty:
+                continue
+            metrics.PUSH_QUEUE_DEPTH.set(self._queue.qsize())
+
+            if key[1] is None or self.coalesce_window <= 0:
+                self._send(key[0], [message_body])
+                continue
+
+            # Each key waits for its own quiet window, capped by its own deadline
+            now = time.monotonic()
+            bucket = buckets.get(key)
+            if bucket is None:
+                bucket = buckets[key] = [[], None, now + self.coalesce_max_delay]
+            else:
+                self.stats['coalesced'] += 1
+            bucket[0].append(message_body)
+            bucket[1] = min(now + self.coalesce_window, bucket[2])
+
+    def _send(self, user_id, batch):
+        try:
+            with self.app.app_context():
+                self.dispatch(self.summarize(batch), user_id=user_id)
+        except Exception as e:
+            logger.error(f"Push dispatch error: {e}")
+
+    @staticmethod
+    def summarize(batch):
+        """Merge several notifications into a single summary message."""
+        if len(batch) == 1:
+            return batch[0]
+
+        lines = [body.get('message', '') for body in batch[:5]]
+        if len(batch) > 5:
+            lines.append(f"... et {len(batch) - 5} autres")
+        return {
+            "title": f"{len(batch)} nouvelles commandes",
+            # Keep well under the ~4KB push payload limit
+            "message": "\n".join(lines)[:1000]
+        }
+
+    def dispatch(self, message_body, user_id=None):
+        """Send one message to user_id's subscriptions (all if None). Needs an app context."""
+        from extensions import db, http_client
+        from models import PushSubscription
+
+        config = self.app.config
+        vapid_private = config.get('VAPID_PRIVATE_KEY')
+        vapid_public = config.get('VAPID_PUBLIC_KEY')
+        vapid_email = config.get('VAPID_CLAIM_EMAIL', 'mailto:admin@example.com')
+
+        if not vapid_private or not vapid_public:
+            logger.error("VAPID keys not configured! Set VAPID_PRIVATE_KEY and VAPID_PUBLIC_KEY")
+            return
+
+        # Snapshot subscriptions and release the DB connection before sending
+        query = PushSubscription.query
+        if user_id is not None:
+            query = query.filter_by(user_id=user_id)
+        subscriptions = [(sub.id, sub.to_dict()) for sub in query.all()]
+        db.session.remove()
+
+        if not subscriptions:
+            logger.warning(f"No push subscriptions found for user {user_id}" if user_id is not None
+                           else "No push subscriptions found in database!")
+            return
+
+        logger.info(f"Sending push to {len(subscriptions)} subscribers: {message_body}")
+
+        if self.vapid_cache is None:
+            self.vapid_cache = VapidHeaderCache(
+                vapid_private, vapid_email,
+                refresh_margin=config.get('VAPID_REFRESH_MARGIN', 5 * 60)
+            )
+
+        data = json.dumps(message_body)
+        expired_ids = []
+
+        def send(sub_id, subscription_info):
+            try:
+                # Same as pywebpush.webpush() but with a cached VAPID signature and
+                # the shared keep-alive client instead of a new connection per send
+                headers = self.vapid_cache.headers_for(subscription_info['endpoint'])
+                response = WebPusher(subscription_info, requests_session=http_client).send(data, headers=headers, ttl=0)
+                if response.status_code > 202:
+                    raise WebPushException(f"Push failed: {response.status_code} {response.reason}",
+                                           response=response)
+                self.stats['sent'] += 1
+            except WebPushException as ex:
+                if ex.response is not None and ex.response.status_code in (404, 410):
+                    expired_ids.append(sub_id)
+                else:
+                    self.stats['failed'] += 1
+                    logger.error(f"WebPush Error for sub {sub_id}: {ex}")
+            except Exception as e:
+                self.stats['failed'] += 1
+                logger.error(f"Push Error for sub {sub_id}: {e}")
+
+        pool = Pool(self.pool_size)
+        for sub_id, subscription_info in subscriptions:
+            pool.spawn(send, sub_id, subscription_info)
+        pool.join()
+
+        if expired_ids:
+            logger.info(f"Removing {len(expired_ids)} expired subscriptions")
+            PushSubscription.query.filter(PushSubscription.id.in_(expired_ids)).delete(synchronize_session=False)
+            db.session.commit()
+            self.stats['expired'] += len(expired_ids)
+
+        logger.info(f"Push complete for {len(subscriptions)} subscriptions, totals: {self.stats}")
@@ -0,0 +1,144 @@
+import logging
+import os
+import secrets
+import time
+
+import gevent
+import websocket
+
+from services import metrics
+
+logger = logging.getLogger(__name__)
+
+OPENAI_WS_URL = "wss://api.openai.com/v1/realtime?model=gpt-realtime"
+
+
+def connect_realtime(api_key, session, url=OPENAI_WS_URL):
+    """Open a realtime WebSocket to OpenAI and send the compiled session.update."""
+    # websocket-client accepts list of strings for headers
+    headers = [
+        f"Authorization: Bearer {api_key}",
+        "OpenAI-Beta: realtime=v1"
+    ]
+    openai_ws = websocket.create_connection(url, header=headers)
+    try:
+        openai_ws.send(session.payload)
+    except Exception:
+        openai_ws.close()
+        raise
+    return openai_ws
+
+
+class WarmConnectionPool:
+    """
+    OpenAI realtime connections opened at /webhooks/answer time.
+
+    answer_call starts connecting (DNS, TLS, upgrade, session.update) in a
+    background greenlet while Vonage is still setting up its WebSocket to
+    us, keyed by a per-call token carried in the NCCO URI. voice_stream
+    claims the warm connection with that token; connections nobody claims
+    within the timeout are closed.
+
+    The pool is per process: with several gunicorn workers the stream may
+    land on a worker that did not answer the call. It then connects cold
+    while the warm connection idles until it expires. Tokens carry the
+    answering worker's pid so those misses are counted separately
+    ('cross_worker' in stats and voice_prewarm_connections_total), and at
+    most max_pending connections are held open per worker.
+    """
+
+    def __init__(self, app=None):
+        self.app = None
+        self.url = OPENAI_WS_URL
+        self.timeout = 30
+        self.claim_wait = 5
+        self.enabled = True
+        self.max_pending = 10
+        self._pending = {}
+        self.stats = {
+            'started': 0,
+            'skipped': 0,
+            'warm': 0,
+            'cold': 0,
+            'cross_worker': 0,
+            'expired': 0,
+            'failed': 0,
+            'ttfa_warm_ms_total': 0,
+            'ttfa_cold_ms_total': 0,
+        }
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.app = app
+        self.url = app.config.get('OPENAI_REALTIME_URL') or self.url
+        self.timeout = app.config.get('REALTIME_PREWARM_TIMEOUT', self.timeout)
+        self.claim_wait = app.config.get('REALTIME_PREWARM_CLAIM_WAIT', self.claim_wait)
+        self.enabled = app.config.get('REALTIME_PREWARM', self.enabled)
+        self.max_pending = app.config.get('REALTIME_PREWARM_MAX_PENDING', self.max_pending)
+        app.extensions['warm_pool'] = self
+
+    @staticmethod
+    def new_token():
+        # The pid prefix tells claim() which worker answered the call
+        return f"{os.getpid()}.{secrets.token_urlsafe(16)}"
+
+    def start(self, token, session):
+        if not self.enabled:
+            return
+        if len(self._pending) >= self.max_pending:
+            self._count('skipped')
+            return
+        api_key = self.app.config['OPENAI_API_KEY']
+        self._pending[token] = {
+            'answered_at': time.monotonic(),
+            'greenlet': gevent.spawn(connect_realtime, api_key, session, self.url),
+        }
+        self._count('started')
+        gevent.spawn_later(self.timeout, self._expire, token)
+
+    def claim(self, token):
+        """
+        Return (openai_ws, answered_at) for a pre-warmed call, waiting briefly
+        if the handshake is still in flight. Returns (None, None) on a miss.
+        """
+        entry = self._pending.pop(token, None) if token else None
+        if entry is None:
+            answered_by = token.partition('.')[0] if token else ''
+            self._count('cross_worker' if answered_by.isdigit() and int(answered_by) != os.getpid() else 'cold')
+            return None, None
+
+        try:
+            openai_ws = entry['greenlet'].get(timeout=self.claim_wait)
+        except Exception as e:
+            logger.warning(f"Pre-warmed OpenAI connection unusable: {e}")
+            self._count('failed')
+            entry['greenlet'].link_value(self._close_result)
+            return None, entry['answered_at']
+
+        self._count('warm')
+        return openai_ws, entry['answered_at']
+
+    def record_first_audio(self, warm, elapsed_ms):
+        key = 'ttfa_warm_ms_total' if warm else 'ttfa_cold_ms_total'
+        self.stats[key] += elapsed_ms
+
+    def _expire(self, token):
+        entry = self._pending.pop(token, None)
+        if entry is None:
+            return
+        self._count('expired')
+        logger.info(f"Closing unclaimed pre-warmed OpenAI connection {token[:8]}")
+        # Close once the connect finishes (or right away if it already has)
+        entry['greenlet'].link_value(self._close_result)
+
+    def _count(self, result):
+        self.stats[result] += 1
+        metrics.PREWARM_CONNECTIONS.labels(result=result).inc()
+
+    @staticmethod
+    def _close_result(greenlet):
+        try:
+            greenlet.value.close()
+        except Exception:
+            pass
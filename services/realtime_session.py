@@ -0,0 +1,146 @@
+import hashlib
+import json
+
+from services.menu import menu_catalog
+
+DEFAULT_INSTRUCTIONS = "You are a helpful AI assistant taking food orders."
+DEFAULT_VOICE = 'sage'
+TOOL_INSTRUCTIONS = "\n\nWhen the order is confirmed, you MUST use the 'create_order_tool' to submit it. Ask for name and address if missing."
+
+CREATE_ORDER_TOOL = {
+    "type": "function",
+    "name": "create_order_tool",
+    "description": "Submit a completed restaurant order after the customer confirms all details.",
+    "parameters": {
+        "type": "object",
+        "properties": {
+            "order_details": {
+                "type": "string",
+                "description": "Full list of ordered items with quantities and options (size, sauce, drink, extras)."
+            },
+            "customer_name": {
+                "type": "string",
+                "description": "Customer's full name as spoken by the caller. Ask to repeat or spell if unclear."
+            },
+            "customer_address": {
+                "type": "string",
+                "description": "Complete delivery address including city, neighborhood, street, building, and apartment if provided."
+            }
+        },
+        "required": ["order_details"]
+    }
+}
+
+LOOKUP_MENU_TOOL = {
+    "type": "function",
+    "name": "lookup_menu",
+    "description": "Look up menu items by name or category to get their price, options and description.",
+    "parameters": {
+        "type": "object",
+        "properties": {
+            "query": {
+                "type": "string",
+                "description": "Item or category the customer asked about, e.g. 'pizza reine' or 'boissons'."
+            }
+        },
+        "required": ["query"]
+    }
+}
+
+TOOLS = [CREATE_ORDER_TOOL]
+# Added for menus too long to carry in full in the instructions
+MENU_TOOLS = [CREATE_ORDER_TOOL, LOOKUP_MENU_TOOL]
+LOOKUP_INSTRUCTIONS = "\n\nThe menu above only lists item names. Before quoting a price, option or description, use the 'lookup_menu' tool."
+
+
+def tools_version():
+    # Changes whenever the shared tool definitions change
+    return hashlib.sha1(json.dumps(MENU_TOOLS, sort_keys=True).encode('utf-8')).hexdigest()
+
+
+def build_instructions(tenant, menu=None):
+    instructions = DEFAULT_INSTRUCTIONS
+    if tenant and tenant['system_prompt']:
+        instructions = tenant['system_prompt']
+    if menu and menu.prompt:
+        # Compact rendering: one line per category, "Name price (options)" entries
+        instructions += f"\n\nHere is the Menu:\n{menu.prompt}"
+        if menu.needs_lookup:
+            instructions += LOOKUP_INSTRUCTIONS
+    return instructions + TOOL_INSTRUCTIONS
+
+
+def build_session_update(tenant, profile):
+    voice = (tenant and tenant['voice']) or DEFAULT_VOICE
+    menu = menu_catalog.get(tenant)
+    return {
+        "type": "session.update",
+        "session": {
+            "modalities": ["text", "audio"],
+            "instructions": build_instructions(tenant, menu),
+            "voice": voice,
+            # pcm16 (24kHz) or g711_ulaw (8kHz), per the tenant's audio profile
+            "input_audio_format": profile.openai_format,
+            "output_audio_format": profile.openai_format,
+            "input_audio_transcription": {       # Enable for better speech recognition
+                "model": "whisper-1"
+            },
+            "turn_detection": {
+                "type": "server_vad",
+                "threshold": 0.5,
+                "prefix_padding_ms": 200,
+                "silence_duration_ms": 400
+            },
+            "tools": MENU_TOOLS if menu and menu.needs_lookup else TOOLS
+        }
+    }
+
+
+class CompiledSession:
+    """A serialized session.update ready to send as-is."""
+
+    def __init__(self, fingerprint, session_update):
+        self.fingerprint = fingerprint
+        self.voice = session_update['session']['voice']
+        self.instructions_len = len(session_update['session']['instructions'])
+        self.payload = json.dumps(session_update)
+
+
+class SessionPayloadCache:
+    """
+    Per-tenant cache of compiled session.update payloads.
+
+    An entry is rebuilt only when the tenant's system_prompt, menu version,
+    voice or audio profile change, or when the shared tool definitions change, so a
+    call does no string building or JSON serialization before its first send.
+    """
+
+    def __init__(self):
+        self._entries = {}
+        self._tools_version = tools_version()
+        self.stats = {'hits': 0, 'builds': 0}
+
+    def get(self, tenant, profile):
+        key = tenant['id'] if tenant else None
+        fingerprint = (
+            (tenant['system_prompt'], tenant['menu_version'], tenant['voice']) if tenant else None,
+            profile.name,
+            self._tools_version
+        )
+
+        entry = self._entries.get(key)
+        if entry is not None and entry.fingerprint == fingerprint:
+            self.stats['hits'] += 1
+            return entry
+
+        self.stats['builds'] += 1
+        entry = CompiledSession(fingerprint, build_session_update(tenant, profile))
+        self._entries[key] = entry
+        return entry
+
+    def refresh_tools(self):
+        """Call after changing TOOLS at runtime so every entry is rebuilt."""
+        self._tools_version = tools_version()
+
+
+session_cache = SessionPayloadCache()
@@ -0,0 +1,66 @@
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+# Columns needed to answer a call; everything else stays in the DB
+# Menus are served from services/menu.py by menu_version, not carried here
+ROUTING_COLUMNS = ('id', 'username', 'phone_e164', 'system_prompt', 'menu_version', 'voice', 'audio_profile',
+                   'agent_on')
+
+
+class TenantRouter:
+    """
+    In-process cache from dialed number (E.164) to tenant call config.
+
+    The first lookup loads every routable tenant in one query; after that,
+    incoming calls (including calls to unknown numbers) resolve without a DB
+    round trip. Admin changes publish a 'tenant_changed' event through the
+    event bus so every worker drops its snapshot, and the snapshot also
+    expires after a TTL as a safety net.
+    """
+
+    def __init__(self, app=None):
+        self.ttl = 300
+        self._tenants = None
+        self._loaded_at = 0
+        self.stats = {'hits': 0, 'loads': 0}
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        from extensions import event_bus
+
+        self.ttl = app.config.get('TENANT_CACHE_TTL', self.ttl)
+        event_bus.on('tenant_changed', lambda data: self.clear())
+        app.extensions['tenant_router'] = self
+
+    def resolve(self, dialed_number):
+        """Return the tenant config dict for a dialed number, or None. Needs an app context."""
+        from models import normalize_phone
+
+        if self._tenants is None or time.monotonic() - self._loaded_at > self.ttl:
+            self._load()
+        else:
+            self.stats['hits'] += 1
+        return self._tenants.get(normalize_phone(dialed_number))
+
+    def _load(self):
+        from models import User
+
+        columns = [getattr(User, name) for name in ROUTING_COLUMNS]
+        rows = User.query.with_entities(*columns).filter(User.phone_e164.isnot(None)).all()
+        self._tenants = {row.phone_e164: dict(zip(ROUTING_COLUMNS, row)) for row in rows}
+        self._loaded_at = time.monotonic()
+        self.stats['loads'] += 1
+        logger.info(f"Loaded routing config for {len(self._tenants)} tenants")
+
+    def clear(self):
+        self._tenants = None
+
+    def invalidate(self):
+        """Drop the routing snapshot in every worker after a tenant change."""
+        from extensions import event_bus
+
+        self.clear()
+        event_bus.publish('tenant_changed', {})
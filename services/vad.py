@@ -0,0 +1,91 @@
+from collections import deque
+
+import numpy as np
+
+
+class SilenceGate:
+    """
+    Local energy / zero-crossing VAD that holds back sustained silence on
+    the uplink to OpenAI.
+
+    Server VAD still makes every turn decision: after speech, audio keeps
+    flowing for hangover_ms (longer than the server's silence_duration_ms)
+    so it can detect speech_stopped, and the last preroll_ms of held-back
+    audio is released ahead of new speech so prefix padding is preserved.
+    While suppressing, one frame is let through every keepalive_ms.
+    """
+
+    def __init__(self, bytes_per_ms, threshold_rms=300.0, hangover_ms=600, preroll_ms=300,
+                 keepalive_ms=1000, max_zcr=0.5):
+        self.bytes_per_ms = bytes_per_ms
+        self.threshold_rms = threshold_rms
+        self.hangover_ms = hangover_ms
+        self.keepalive_ms = keepalive_ms
+        self.max_zcr = max_zcr
+        self.preroll_ms = preroll_ms
+        self._preroll = deque()
+        self._preroll_held_ms = 0
+        self._noise_rms = threshold_rms / 2
+        self._silence_ms = 0
+        self._since_keepalive_ms = 0
+        self._open = True
+        self.stats = {'frames': 0, 'suppressed': 0, 'audio_ms': 0, 'suppressed_ms': 0}
+
+    def is_speech(self, frame):
+        samples = np.frombuffer(frame, dtype='<i2').astype(np.float32)
+        if samples.size == 0:
+            return False
+        rms = float(np.sqrt(np.dot(samples, samples) / samples.size))
+        signs = np.signbit(samples)
+        zcr = np.count_nonzero(signs[1:] != signs[:-1]) / samples.size
+
+        # Track the background level so a noisy line doesn't look like speech
+        threshold = max(self.threshold_rms, self._noise_rms * 3)
+        speech = rms > threshold and zcr < self.max_zcr
+        if not speech:
+            self._noise_rms = 0.95 * self._noise_rms + 0.05 * rms
+        return speech
+
+    def process(self, frame):
+        """
+        Returns (frames_to_send, closed). closed is True on the frame where
+        the gate starts suppressing, so the caller can flush its buffers.
+        """
+        frame_ms = len(frame) / self.bytes_per_ms
+        self.stats['frames'] += 1
+        self.stats['audio_ms'] += frame_ms
+
+        if self.is_speech(frame):
+            self._silence_ms = 0
+            # Held-back preroll is sent after all, so it wasn't suppressed
+            self.stats['suppressed'] -= len(self._preroll)
+            self.stats['suppressed_ms'] -= self._preroll_held_ms
+            released = list(self._preroll) + [frame]
+            self._preroll.clear()
+            self._preroll_held_ms = 0
+            self._open = True
+            return released, False
+
+        self._silence_ms += frame_ms
+        if self._open and self._silence_ms <= self.hangover_ms:
+            return [frame], False
+
+        closed = self._open
+        self._open = False
+
+        self._since_keepalive_ms += frame_ms
+        if self._since_keepalive_ms >= self.keepalive_ms:
+            self._since_keepalive_ms = 0
+            return [frame], closed
+
+        self.stats['suppressed'] += 1
+        self.stats['suppressed_ms'] += frame_ms
+        self._preroll.append(frame)
+        self._preroll_held_ms += frame_ms
+        while self._preroll_held_ms > self.preroll_ms:
+            self._preroll_held_ms -= len(self._preroll.popleft()) / self.bytes_per_ms
+        return [], closed
+
+    def summary(self):
+        fraction = self.stats['suppressed_ms'] / self.stats['audio_ms'] if self.stats['audio_ms'] else 0
+        return f"vad suppressed={fraction:.0%} of {self.stats['audio_ms'] / 1000:.1f}s"
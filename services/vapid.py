@@ -0,0 +1,44 @@
+import time
+from urllib.parse import urlparse
+
+from py_vapid import Vapid
+
+
+class VapidHeaderCache:
+    """
+    Signed VAPID Authorization headers, cached per push-service origin.
+
+    The JWT only depends on the audience (scheme://host of the endpoint), the
+    subject and the expiry, so every subscription on the same push service
+    can share one signature until shortly before it expires.
+    """
+
+    def __init__(self, private_key, claim_email, ttl=12 * 60 * 60, refresh_margin=5 * 60):
+        self.vapid = Vapid.from_string(private_key=private_key)
+        self.claim_email = claim_email
+        self.ttl = ttl
+        self.refresh_margin = refresh_margin
+        self._entries = {}
+        self.stats = {'hits': 0, 'misses': 0}
+
+    @staticmethod
+    def audience(endpoint):
+        url = urlparse(endpoint)
+        return f"{url.scheme}://{url.netloc}"
+
+    def headers_for(self, endpoint):
+        """Return a fresh copy of the VAPID headers for this endpoint."""
+        aud = self.audience(endpoint)
+        now = time.time()
+
+        entry = self._entries.get(aud)
+        if entry and now < entry[1] - self.refresh_margin:
+            self.stats['hits'] += 1
+            return dict(entry[0])
+
+        self.stats['misses'] += 1
+        exp = int(now) + self.ttl
+        headers = self.vapid.sign({'sub': self.claim_email, 'aud': aud, 'exp': exp})
+        self._entries[aud] = (headers, exp)
+        # Callers (WebPusher.send) add their own headers to the dict
+        return dict(headers)
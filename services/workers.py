@@ -0,0 +1,34 @@
+import os
+
+import gevent
+
+
+class ProcessGreenlets:
+    """
+    Background greenlets owned by the current process.
+
+    Services start their greenlets lazily through ensure() instead of at
+    import or init_app time: gunicorn forks workers after the app is
+    created, and greenlets inherited from the master never run in the child.
+    After a fork, on_fork is called first so the owner can replace other
+    per-process state (queues) before new greenlets are spawned. Greenlets
+    that died are respawned until count are running again.
+    """
+
+    def __init__(self, target, count=1, on_fork=None):
+        self.target = target
+        self.count = count
+        self.on_fork = on_fork
+        self._pid = None
+        self._greenlets = []
+
+    def ensure(self):
+        pid = os.getpid()
+        if self._pid != pid:
+            self._pid = pid
+            self._greenlets = []
+            if self.on_fork is not None:
+                self.on_fork()
+        alive = [greenlet for greenlet in self._greenlets if not greenlet.dead]
+        alive += [gevent.spawn(self.target) for _ in range(self.count - len(alive))]
+        self._greenlets = alive